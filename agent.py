@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Агент вузла для hub-режиму
+Запускається на кожному сенсорному вузлі і підключається до бота (hub.py)
+
+    python3 agent.py --name kali-1 --hub 10.0.0.5:8765
+"""
+
+import argparse
+import asyncio
+import hmac
+import logging
+import os
+import socket
+import sys
+import tempfile
+
+from dotenv import load_dotenv
+
+from captures import find_handshake_files
+from pcapmerge import merge_captures
+from supervisor import Supervisor
+from hub import (
+    CHUNK_SIZE,
+    HEARTBEAT_TIMEOUT,
+    INITIAL_WINDOW,
+    PROTOCOL_VERSION,
+    CreditGate,
+    FrameConnection,
+    ProtocolError,
+    auth_proof,
+    encode_frame,
+    new_nonce,
+)
+
+# Завантажуємо змінні середовища
+load_dotenv()
+
+# Налаштування логування
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_MAX = 60  # сек між спробами підключення
+
+
+class Agent:
+    """Керує процесами і файлами вузла за командами бота"""
+
+    def __init__(self, name: str, host: str, port: int, secret: str):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.conn: FrameConnection = None
+        self.gate: CreditGate = None
+        self.processes: dict = {}
+        self.tasks: set = set()
+        self.supervisor = Supervisor()
+
+    async def run_forever(self):
+        """Підключається до бота і перепідключається після розриву"""
+        delay = 1
+        while True:
+            try:
+                await self.session()
+                delay = 1
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ProtocolError) as e:
+                logger.warning(f"Немає з'єднання з hub {self.host}:{self.port}: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    async def session(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        conn = FrameConnection(reader, writer)
+        challenge, _ = await asyncio.wait_for(conn.recv(), timeout=HEARTBEAT_TIMEOUT)
+        if challenge.get("t") != "challenge" or challenge.get("v") != PROTOCOL_VERSION:
+            writer.close()
+            raise ProtocolError("hub не надіслав challenge або інша версія протоколу")
+
+        nonce = new_nonce()
+        hub_nonce = str(challenge.get("nonce", ""))
+        writer.write(encode_frame({
+            "t": "hello", "v": PROTOCOL_VERSION, "name": self.name, "nonce": nonce,
+            "proof": auth_proof(self.secret, "agent", self.name, hub_nonce, nonce),
+        }))
+        await writer.drain()
+
+        reply, _ = await asyncio.wait_for(conn.recv(), timeout=HEARTBEAT_TIMEOUT)
+        if reply.get("t") != "welcome":
+            writer.close()
+            raise ProtocolError(reply.get("error", "hub відхилив підключення"))
+        # Без цього будь-хто на адресі hub міг би запускати команди на вузлі
+        expected = auth_proof(self.secret, "hub", self.name, nonce, hub_nonce)
+        if not hmac.compare_digest(str(reply.get("proof", "")), expected):
+            writer.close()
+            raise ProtocolError("hub не підтвердив знання секрету")
+
+        self.conn = conn
+        self.gate = CreditGate(reply.get("window", INITIAL_WINDOW))
+        logger.info(f"Підключено до hub як '{self.name}'")
+        try:
+            await conn.run(self.handle)
+        finally:
+            for task in list(self.tasks):
+                task.cancel()
+            await self.stop_all()
+            logger.info("З'єднання з hub втрачено")
+
+    def _spawn_task(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle(self, msg: dict, body: bytes):
+        kind = msg.get("t")
+        ch = msg.get("ch")
+        if kind == "credit":
+            self.gate.grant(msg.get("n", 0))
+        elif kind == "stdin":
+            proc = self.processes.get(ch)
+            if proc and proc.returncode is None:
+                try:
+                    proc.stdin.write(body)
+                    await proc.stdin.drain()
+                except Exception as e:
+                    logger.error(f"Помилка запису в stdin: {e}")
+        elif kind == "signal":
+            proc = self.processes.get(ch)
+            if proc and proc.returncode is None:
+                try:
+                    proc.send_signal(msg.get("sig"))
+                except ProcessLookupError:
+                    pass
+        elif kind == "stop":
+            self._spawn_task(self.stop(ch, msg.get("target")))
+        elif kind == "spawn":
+            self._spawn_task(self.spawn(ch, msg.get("cmd", [])))
+        elif kind == "list":
+            self._spawn_task(self.list_captures(ch))
+        elif kind == "fetch":
+            self._spawn_task(self.fetch(ch, msg.get("path", "")))
+        elif kind == "merge":
+            self._spawn_task(self.merge(ch, msg.get("paths", []), msg.get("handshake_only", False)))
+        else:
+            logger.warning(f"Невідомий кадр: {kind}")
+
+    async def spawn(self, ch: int, command: list):
+        """Запускає процес і транслює його вивід у hub"""
+        try:
+            proc = await self.supervisor.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except Exception as e:
+            self.conn.send({"t": "error", "ch": ch, "error": str(e)})
+            return
+
+        logger.info(f"Процес запущено: {' '.join(command)} (PID {proc.pid})")
+        self.processes[ch] = proc
+        self.conn.send({"t": "result", "ch": ch, "pid": proc.pid})
+        try:
+            await asyncio.gather(
+                self._pump(ch, proc.stdout, 1),
+                self._pump(ch, proc.stderr, 2),
+            )
+            returncode = await proc.wait()
+        finally:
+            self.processes.pop(ch, None)
+        self.conn.send({"t": "exit", "ch": ch, "code": returncode})
+
+    async def stop(self, ch: int, target: int):
+        """Зупиняє процес разом з нащадками і звітує про ті, що лишились"""
+        proc = self.processes.get(target)
+        if proc is None:
+            self.conn.send({"t": "result", "ch": ch, "signal": "-", "leaked": []})
+            return
+        report = await self.supervisor.stop(proc)
+        self.conn.send({"t": "result", "ch": ch, "signal": report.signal,
+                        "leaked": [[p.pid, p.comm] for p in report.leaked]})
+
+    async def _pump(self, ch: int, stream, fd: int):
+        # read() повертає все, що накопичилось - природне пакетування рядків
+        while True:
+            data = await stream.read(CHUNK_SIZE)
+            if not data:
+                break
+            await self.gate.acquire(len(data))
+            self.conn.send({"t": "out", "ch": ch, "fd": fd}, data)
+
+    async def list_captures(self, ch: int):
+        files = await asyncio.to_thread(find_handshake_files)
+        self.conn.send({"t": "result", "ch": ch, "files": [list(f) for f in files]})
+
+    async def fetch(self, ch: int, path: str):
+        """Потоково передає файл захоплення з урахуванням кредиту"""
+        # Віддаємо тільки файли хендшейків, а не довільні шляхи
+        files = await asyncio.to_thread(find_handshake_files)
+        if path not in {f.path for f in files}:
+            self.conn.send({"t": "error", "ch": ch, "error": f"файл недоступний: {path}"})
+            return
+        try:
+            f = await asyncio.to_thread(open, path, 'rb')
+        except OSError as e:
+            self.conn.send({"t": "error", "ch": ch, "error": str(e)})
+            return
+        try:
+            await self._stream(ch, f)
+        finally:
+            f.close()
+        self.conn.send({"t": "result", "ch": ch})
+
+    async def merge(self, ch: int, paths: list, handshake_only: bool):
+        """Об'єднує файли захоплення на вузлі і передає тільки результат"""
+        allowed = {f.path for f in await asyncio.to_thread(find_handshake_files)}
+        denied = [p for p in paths if p not in allowed]
+        if denied:
+            self.conn.send({"t": "error", "ch": ch, "error": f"файл недоступний: {denied[0]}"})
+            return
+        with tempfile.TemporaryFile() as f:
+            try:
+                stats = await asyncio.to_thread(merge_captures, paths, f, handshake_only)
+            except OSError as e:
+                self.conn.send({"t": "error", "ch": ch, "error": str(e)})
+                return
+            f.seek(0)
+            await self._stream(ch, f)
+        self.conn.send({"t": "result", "ch": ch, "stats": stats.as_dict()})
+
+    async def _stream(self, ch: int, f):
+        """Передає файл кусками з урахуванням кредиту"""
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            await self.gate.acquire(len(chunk))
+            self.conn.send({"t": "chunk", "ch": ch}, chunk)
+
+    async def stop_all(self):
+        """Зупиняє процеси, що лишились без керування після розриву"""
+        procs = [p for p in self.processes.values() if p.returncode is None]
+        await asyncio.gather(*(self.supervisor.stop(p) for p in procs), return_exceptions=True)
+        self.processes.clear()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Агент вузла для hub-режиму бота")
+    parser.add_argument("--name", default=os.getenv("NODE_NAME", socket.gethostname()),
+                        help="ім'я вузла в чаті")
+    parser.add_argument("--hub", default=os.getenv("HUB_ADDR", "127.0.0.1:8765"),
+                        help="адреса бота host:port")
+    return parser.parse_args()
+
+
+def main():
+    """Головна функція"""
+    args = parse_args()
+    secret = os.getenv("HUB_SECRET")
+    if not secret:
+        logger.error("HUB_SECRET не налаштований в .env файлі")
+        sys.exit(1)
+
+    host, _, port = args.hub.rpartition(":")
+    agent = Agent(args.name, host, int(port), secret)
+    logger.info(f"Агент '{args.name}' запущено...")
+    asyncio.run(agent.run_forever())
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Агент зупинено")
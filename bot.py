@@ -5,24 +5,49 @@
 """
 
 import asyncio
+import functools
 import logging
 import os
 import sys
-import glob
+import tempfile
+import time
+import weakref
+from collections import deque
 from datetime import datetime
 from typing import Optional
 
-from telegram import Update, ReplyKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, ReplyKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import (Application, CallbackQueryHandler, CommandHandler, MessageHandler,
+                          filters, ContextTypes)
 from dotenv import load_dotenv
 
+from captures import CaptureIndex, find_handshake_files, format_mtime, format_size
+from history import History
+from httppools import RoutingRequest, TrackedRequest
+from hub import LOCAL_NODE, HubServer, RemoteError, RemoteProcess
+from logsetup import SessionLog, setup_logging
+from tracing import SPANS, Tracer
+from updates import ChatOrderedUpdateProcessor
+from loopwatch import LoopWatchdog
+from memprof import MemoryProfiler, format_site, rss_bytes, task_counts
+from pcapmerge import MERGE_EXTENSIONS, merge_captures
+from keyinput import InputBatcher, format_keys, parse_keys
+from jobs import JobQueue, Scheduler, format_interval, parse_interval, parse_limits
+from supervisor import Supervisor
+from watchers import LEVELS, SCOPES, StreamWatch, WatchRule, WatchSet
+
 # Завантажуємо змінні середовища
 load_dotenv()
 
-# Налаштування логування
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Налаштування логування (запис у файли - у фоновому потоці)
+OUTPUT_LOG_RATE = float(os.getenv('OUTPUT_LOG_RATE', '20'))  # рядків/с на сесію
+OUTPUT_LOG_BURST = int(os.getenv('OUTPUT_LOG_BURST', '100'))
+setup_logging(
+    log_file=os.getenv('LOG_FILE', 'bot.log'),
+    output_file=os.getenv('OUTPUT_LOG_FILE', 'output.log'),
+    max_bytes=int(float(os.getenv('LOG_MAX_MB', '5')) * 1024 * 1024),
+    backup_count=int(os.getenv('LOG_BACKUPS', '5')),
 )
 logger = logging.getLogger(__name__)
 
@@ -34,22 +59,105 @@ if not BOT_TOKEN or not ADMIN_CHAT_ID:
     logger.error("BOT_TOKEN або ADMIN_CHAT_ID не налаштовані в .env файлі")
     sys.exit(1)
 
+# Hub-режим: агенти вузлів (agent.py) підключаються до бота
+HUB_HOST = os.getenv('HUB_HOST', '127.0.0.1')
+HUB_PORT = int(os.getenv('HUB_PORT', '0'))  # 0 - hub вимкнено
+HUB_SECRET = os.getenv('HUB_SECRET', '')
+
+if HUB_PORT and not HUB_SECRET:
+    logger.error("HUB_SECRET не налаштований в .env файлі")
+    sys.exit(1)
+
+# Історія команд і сесій
+HISTORY_DB = os.getenv('HISTORY_DB', 'history.db')
+history = History(HISTORY_DB)
+
+# Файлів на сторінці перегляду хендшейків
+CAPTURES_PAGE_SIZE = int(os.getenv('CAPTURES_PAGE_SIZE', '8'))
+MAX_UPLOAD = 50 * 1024 * 1024  # Ліміт Bot API на відправку файлу
+
+# Нагляд за деревами процесів (tmux-сервер airgeddon, нащадки завдань)
+supervisor = Supervisor(float(os.getenv('SUPERVISOR_SCAN', '2')))
+
+# Черга завдань: /run, /bg і командний рядок
+JOBS_MAX = int(os.getenv('JOBS_MAX', '2'))
+JOBS_LIMITS = parse_limits(os.getenv('JOBS_LIMITS', 'scan=1,crack=1'))
+JOBS_TIMEOUT = float(os.getenv('JOBS_TIMEOUT', '600'))  # сек, для /bg
+JOBS_NICE = int(os.getenv('JOBS_NICE', '10'))
+RUN_TIMEOUT = 60  # сек, для /run
+
+jobs = JobQueue(JOBS_MAX, JOBS_LIMITS, JOBS_TIMEOUT, JOBS_NICE, history, supervisor)
+scheduler = Scheduler(jobs)
+
+# Трасування затримок взаємодії (/trace)
+tracer = Tracer(int(os.getenv('TRACE_RING', '500')))
+
+# Сторож event loop: затримки циклу і стеки блокуючих викликів (/lag)
+loop_watchdog = LoopWatchdog(float(os.getenv('LAG_THRESHOLD_MS', '100')) / 1000)
+
+# Профілювання пам'яті на вимогу (/mem), за замовчуванням вимкнено
+memory = MemoryProfiler()
+
+# Правила спостереження за виводом (/watch), завантажуються з історії в post_init
+watchset = WatchSet()
+
+# Паралельна обробка оновлень
+UPDATES_CONCURRENCY = int(os.getenv('UPDATES_CONCURRENCY', '32'))
+
+# Окремі пули HTTP-з'єднань: getUpdates, легкі виклики API, відправка файлів (/http)
+HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', '30'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+updates_request = TrackedRequest(
+    "updates", 1, read_timeout=10, write_timeout=10, connect_timeout=HTTP_CONNECT_TIMEOUT,
+    pool_timeout=5, keepalive=HTTP_KEEPALIVE,
+)
+api_request = TrackedRequest(
+    "api", int(os.getenv('HTTP_API_POOL', '8')),
+    read_timeout=float(os.getenv('HTTP_API_TIMEOUT', '10')), write_timeout=10,
+    connect_timeout=HTTP_CONNECT_TIMEOUT, pool_timeout=float(os.getenv('HTTP_API_POOL_TIMEOUT', '5')),
+    keepalive=HTTP_KEEPALIVE,
+)
+media_request = TrackedRequest(
+    "media", int(os.getenv('HTTP_MEDIA_POOL', '2')),
+    read_timeout=60, write_timeout=float(os.getenv('HTTP_MEDIA_TIMEOUT', '300')),
+    connect_timeout=HTTP_CONNECT_TIMEOUT, pool_timeout=float(os.getenv('HTTP_MEDIA_POOL_TIMEOUT', '600')),
+    keepalive=HTTP_KEEPALIVE,
+)
+http_pools = [updates_request, api_request, media_request]
+
+# Ввід у програму: пауза для пакетування натискань і спосіб підтвердження
+INPUT_BATCH_DELAY = float(os.getenv('INPUT_BATCH_MS', '150')) / 1000
+INPUT_ACK = os.getenv('INPUT_ACK', 'reaction')  # reaction - реакція на повідомлення, status - рядок статусу
+INPUT_ACK_REACTION = "👍"
+
 # Глобальні змінні для процесу
 active_process: Optional[asyncio.subprocess.Process] = None
 waiting_manual_input: bool = False
 waiting_command: bool = False  # Режим очікування команди для Start Program
 
+# Hub-режим
+hub: Optional[HubServer] = None
+selected_node: str = LOCAL_NODE  # Вузол, на якому виконуються дії
+
 
 def get_main_keyboard():
     """Головна клавіатура"""
     keyboard = [
         ["🚀 Start Program", "📡 Airgeddon"],
-        ["📦 Хендшейки"],
+        ["📦 Хендшейки", "🖧 Вузли"],
         ["🛑 Stop Program", "📊 Status"]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+def get_nodes_keyboard():
+    """Клавіатура вибору вузла"""
+    names = [LOCAL_NODE] + (sorted(hub.nodes) if hub else [])
+    keyboard = [[f"🖧 {name}" for name in names[i:i + 3]] for i in range(0, len(names), 3)]
+    keyboard.append(["🔙 Назад"])
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+
 def get_airgeddon_keyboard():
     """Клавіатура для Airgeddon з цифрами"""
     keyboard = [
@@ -66,25 +174,50 @@ def get_command_keyboard():
     """Клавіатура для режиму командного рядка"""
     keyboard = [
         ["🔄 Оновити", "⛔ Ctrl+C"],
-        ["🔙 Назад"]
+        ["📜 Хвіст", "🔙 Назад"]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
 # Глобальні змінні для командного рядка
-command_process: Optional[asyncio.subprocess.Process] = None
-command_output: str = ""
+command_job = None  # Останнє завдання командного рядка (jobs.Job)
+
+
+def format_new_output(job, viewer, max_lines: int) -> Optional[str]:
+    """Вивід, що з'явився після попереднього перегляду цього глядача"""
+    lines, missed = job.output_buffer.read_new(viewer)
+    if not lines and not missed:
+        return None
+    
+    notes = []
+    if missed:
+        notes.append(f"⚠️ Пропущено {missed} рядк(ів) - витіснені з буфера")
+    if len(lines) > max_lines:
+        notes.append(f"...(показано останні {max_lines} з {len(lines)} нових рядків)")
+        lines = lines[-max_lines:]
+    output = "".join(lines).strip()
+    if len(output) > 3500:
+        output = output[-3500:]
+    
+    text = "\n".join(notes)
+    if output:
+        text += f"\n```\n{output}\n```"
+    return text.strip()
 
 
 async def check_admin(update: Update) -> bool:
     """Перевірка чи користувач - адмін"""
     if update.effective_chat.id != ADMIN_CHAT_ID:
-        await update.message.reply_text("⛔ У вас немає доступу до цього бота")
+        if update.callback_query:
+            await update.callback_query.answer("⛔ У вас немає доступу до цього бота", show_alert=True)
+        else:
+            await update.message.reply_text("⛔ У вас немає доступу до цього бота")
         return False
     return True
 
 
-async def read_stream_and_send(stream, context, chat_id, prefix=""):
+async def read_stream_and_send(stream, context, chat_id, prefix="", run=None, session_log=None,
+                               watch: Optional[StreamWatch] = None):
     """Читає потік та відправляє в чат - збирає весь блок і відправляє разом"""
     buffer = []
     last_send_time = 0
@@ -103,6 +236,7 @@ async def read_stream_and_send(stream, context, chat_id, prefix=""):
                             msg = msg[-4000:]
                         try:
                             await context.bot.send_message(chat_id=chat_id, text=msg)
+                            tracer.output_delivered()
                         except Exception as e:
                             logger.error(f"Помилка відправки: {e}")
                     buffer = []
@@ -111,10 +245,19 @@ async def read_stream_and_send(stream, context, chat_id, prefix=""):
             
             if not line:
                 break
+            tracer.output_received()
+            if run:
+                run.bytes_out += len(line)
                 
             decoded = line.decode('utf-8', errors='replace').strip()
             if decoded:
-                logger.info(f"{prefix}{decoded}")
+                if session_log:
+                    session_log.line(prefix + decoded)
+                if watch:
+                    alert = watch.feed(decoded)
+                    if alert:
+                        source = f"{run.node}: {run.command}" if run else prefix.strip()
+                        run_in_background(send_alert(context.bot, chat_id, alert, source))
                 buffer.append(decoded)
                 last_send_time = asyncio.get_event_loop().time()
         
@@ -126,39 +269,217 @@ async def read_stream_and_send(stream, context, chat_id, prefix=""):
                     msg = msg[-4000:]
                 try:
                     await context.bot.send_message(chat_id=chat_id, text=msg)
+                    tracer.output_delivered()
                 except Exception as e:
                     logger.error(f"Помилка відправки: {e}")
     except Exception as e:
         logger.error(f"Помилка читання потоку: {e}")
 
 
+# Замки сесій: записи в stdin одного процесу не перемішуються
+session_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def write_to_process(proc, data: bytes):
+    """Пише в stdin процесу під замком його сесії"""
+    lock = session_locks.get(proc)
+    if lock is None:
+        lock = session_locks[proc] = asyncio.Lock()
+    async with lock:
+        proc.stdin.write(data)
+        await proc.stdin.drain()
+
+
+# Рядок статусу вводу: одне повідомлення, що редагується замість нових
+input_status_message = None
+input_status_keys: deque = deque(maxlen=30)
+
+
+async def update_input_status(message, keys: list):
+    global input_status_message
+    input_status_keys.extend(keys)
+    text = f"⌨️ Надіслано: {format_keys(list(input_status_keys))}"
+    if input_status_message:
+        try:
+            await input_status_message.edit_text(text)
+            return
+        except BadRequest as e:
+            if "not modified" in str(e):
+                return
+    input_status_message = await message.reply_text(text)
+
+
+async def acknowledge_input(batch, error):
+    """Після запису пакета: реакція на останнє повідомлення або рядок статусу"""
+    message = batch.items[-1][0]
+    if error:
+        await message.reply_text(f"❌ Помилка: {error}", reply_markup=get_airgeddon_keyboard())
+        return
+    for _, trace in batch.items:
+        if trace:
+            tracer.stdin_written(trace)
+    if INPUT_ACK == "reaction":
+        try:
+            await message.set_reaction(INPUT_ACK_REACTION)
+            return
+        except TelegramError as e:
+            logger.warning(f"Реакція недоступна, підтверджую рядком статусу: {e}")
+    await update_input_status(message, batch.keys)
+
+
+input_batcher = InputBatcher(write_to_process, acknowledge_input, INPUT_BATCH_DELAY)
+
+
+async def send_keys(update: Update, keys: list, trace=None, immediate: bool = False) -> bool:
+    """Ставить клавіші в пакет вводу активного процесу; False - процесу немає"""
+    if not (active_process and active_process.returncode is None):
+        await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_main_keyboard())
+        return False
+    input_batcher.submit(active_process, keys, (update.message, trace), immediate)
+    return True
+
+
+async def stop_process(proc):
+    """Зупиняє процес разом з усіма нащадками (SIGINT -> SIGTERM -> SIGKILL)"""
+    if isinstance(proc, RemoteProcess):
+        return await proc.stop()
+    return await supervisor.stop(proc)
+
+
+def format_leaked(leaked: list) -> str:
+    """Рядок про процеси, що пережили зупинку"""
+    if not leaked:
+        return ""
+    return "\n⚠️ Не вдалося зупинити: " + ", ".join(f"{pid} ({comm})" for pid, comm, *_ in leaked)
+
+
+# Фонові задачі обробників (щоб їх не прибрав GC до завершення)
+background_tasks: set = set()
+
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def send_alert(bot, chat_id, alert, source: str):
+    """Сповіщення про збіг правила /watch; звук - якщо його не вимкнено в правилі"""
+    patterns = ", ".join(f"#{rule.id} «{rule.pattern}»" for rule in alert.rules)
+    lines = [f"{LEVELS[alert.level]} {patterns}", f"📍 {source[:100]}", ""]
+    lines += [f"  {line[:300]}" for line in alert.context]
+    lines.append(f"➤ {alert.line[:1000]}")
+    if alert.suppressed:
+        lines.append(f"\n(+{alert.suppressed} повторів приглушено)")
+    try:
+        await bot.send_message(chat_id=chat_id, text="\n".join(lines)[:4000],
+                               disable_notification=not alert.sound)
+    except TelegramError as e:
+        logger.error(f"Помилка відправки сповіщення: {e}")
+
+
+# Стан спостереження виводу завдань черги (/run, /bg, /every, командний рядок)
+job_watches: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+# Повторювані команди: один стан на розклад, щоб приглушення повторів діяло між запусками
+schedule_watches: dict = {}
+
+
+def new_job_watch(job) -> StreamWatch:
+    if job.kind == "schedule":
+        for schedule in scheduler.schedules.values():
+            if schedule.job is job:
+                watch = schedule_watches.get(schedule.id)
+                if watch is None:
+                    watch = schedule_watches[schedule.id] = StreamWatch(watchset, job.kind)
+                watch.recent.clear()    # Контекст - тільки з поточного запуску
+                return watch
+    return StreamWatch(watchset, job.kind)
+
+
+def watch_job_line(bot, job, text: str):
+    """Перевіряє рядок завдання правилами /watch - навіть коли вивід не пересилається"""
+    text = text.strip()
+    if not text or not watchset.rules:
+        return
+    watch = job_watches.get(job)
+    if watch is None:
+        watch = job_watches[job] = new_job_watch(job)
+    alert = watch.feed(text)
+    if alert:
+        run_in_background(send_alert(bot, ADMIN_CHAT_ID, alert, f"#{job.id} {job.command}"))
+
+
+def get_selected_node():
+    """Повертає підключений вузол або None для локального режиму"""
+    if selected_node == LOCAL_NODE or not hub:
+        return None
+    node = hub.get(selected_node)
+    if node is None:
+        raise RuntimeError(f"вузол '{selected_node}' не підключений")
+    return node
+
+
+async def list_captures(node) -> list:
+    """Список хендшейків на вузлі або локально (без блокування event loop)"""
+    if node:
+        return await node.list_captures()
+    return await asyncio.to_thread(find_handshake_files)
+
+
+async def record_new_captures(run, node, before: set):
+    """Записує в історію файли захоплення, що з'явились під час сесії"""
+    try:
+        for f in await list_captures(node):
+            if f.path not in before:
+                history.add_capture(run, run.node, f.path, f.size, f.mtime)
+    except Exception as e:
+        logger.error(f"Помилка пошуку нових хендшейків: {e}")
+
+
 async def start_process(command, context, chat_id):
-    """Запускає процес"""
-    global active_process
+    """Запускає процес (локально або на вибраному вузлі)"""
+    global active_process, input_status_message
     
+    run = None
     try:
-        active_process = await asyncio.create_subprocess_exec(
-            *command,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
+        node = get_selected_node()
+        captures_before = {f.path for f in await list_captures(node)}
+        if node:
+            # RemoteProcess має той самий інтерфейс, що й asyncio Process
+            active_process = await node.spawn(command)
+        else:
+            active_process = await supervisor.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
         
+        input_status_message = None
+        input_status_keys.clear()
         await context.bot.send_message(
             chat_id=chat_id,
-            text=f"✅ Процес запущено: {' '.join(command)}\nPID: {active_process.pid}",
+            text=f"✅ Процес запущено: {' '.join(command)}\nВузол: {selected_node}\nPID: {active_process.pid}",
             reply_markup=get_airgeddon_keyboard()
         )
+        run = history.start_run("session", selected_node, ' '.join(command))
+        session_log = SessionLog(f"{selected_node}:{active_process.pid}", OUTPUT_LOG_RATE, OUTPUT_LOG_BURST)
+        # Спільний на обидва потоки: контекст сповіщення - останні рядки сесії
+        watch = StreamWatch(watchset, "session")
         
         stdout_task = asyncio.create_task(
-            read_stream_and_send(active_process.stdout, context, chat_id, "[OUT] ")
+            read_stream_and_send(active_process.stdout, context, chat_id, "[OUT] ", run, session_log, watch)
         )
         stderr_task = asyncio.create_task(
-            read_stream_and_send(active_process.stderr, context, chat_id, "[ERR] ")
+            read_stream_and_send(active_process.stderr, context, chat_id, "[ERR] ", run, session_log, watch)
         )
         
         returncode = await active_process.wait()
         await asyncio.gather(stdout_task, stderr_task, return_exceptions=True)
+        session_log.close()
+        history.finish_run(run, returncode)
+        await record_new_captures(run, node, captures_before)
         
         await context.bot.send_message(
             chat_id=chat_id,
@@ -168,6 +489,8 @@ async def start_process(command, context, chat_id):
         
     except Exception as e:
         logger.error(f"Помилка запуску процесу: {e}")
+        if run and run.finished is None:
+            history.finish_run(run, None)
         await context.bot.send_message(chat_id=chat_id, text=f"❌ Помилка: {e}")
     finally:
         active_process = None
@@ -182,7 +505,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "👋 Вітаю! Бот для керування програмами.\n\n"
         "🚀 Start Program - командний рядок\n"
         "📡 Airgeddon - запустити airgeddon\n"
-        "📦 Хендшейки - скачати захоплені файли",
+        "📦 Хендшейки - скачати захоплені файли (/captures текст - пошук за ім'ям або ESSID)\n\n"
+        "/run, /bg - виконати команду через чергу, /jobs, /kill\n"
+        "/history - останні запуски, /stats - статистика\n"
+        "/watch текст - сповіщення, коли рядок з'явиться у виводі",
         reply_markup=get_main_keyboard()
     )
 
@@ -205,153 +531,503 @@ async def button_start_program(update: Update, context: ContextTypes.DEFAULT_TYP
     )
 
 
+# Опції /run і /bg: /bg -p 5 -t 300 -m 256 -c scan nmap ...
+JOB_OPTIONS = {"-p": "priority", "-t": "timeout", "-m": "mem_limit", "-c": "category"}
+
+JOB_STATES = {
+    "queued": "⏳ в черзі",
+    "running": "▶️ виконується",
+    "done": "✅ виконано",
+    "failed": "❌ помилка",
+    "killed": "⛔ зупинено",
+    "timeout": "⏰ таймаут",
+}
+
+
+def parse_job_command(text: str):
+    """Розбирає '/bg -p 5 nmap ...' на (опції, команда) без втрати лапок у команді"""
+    parts = text.split(maxsplit=1)
+    rest = parts[1] if len(parts) > 1 else ""
+    options = {}
+    while True:
+        parts = rest.split(maxsplit=2)
+        if len(parts) < 2 or parts[0] not in JOB_OPTIONS:
+            break
+        key = JOB_OPTIONS[parts[0]]
+        options[key] = parts[1] if key == "category" else float(parts[1])
+        rest = parts[2] if len(parts) > 2 else ""
+    for key in ("priority", "mem_limit"):
+        if key in options:
+            options[key] = int(options[key])
+    return options, rest.strip()
+
+
+def format_job(job) -> str:
+    """Короткий опис завдання для чату"""
+    line = f"#{job.id} [{job.category}] {JOB_STATES[job.state]}"
+    if job.started is not None:
+        line += f" ⏱ {job.duration:.1f}s"
+    if job.returncode is not None:
+        line += f" код {job.returncode}"
+    return f"{line}\n   {job.command[:60]}"
+
+
+def job_report(job) -> str:
+    """Звіт про завершення завдання"""
+    return (f"🏁 Завдання #{job.id}: {JOB_STATES[job.state]}\n"
+            f"`{job.command[:200]}`\n"
+            f"Код: {job.returncode} | ⏱ {job.duration:.1f} с")
+
+
 async def run_shell_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Виконує shell команду і повертає результат"""
-    global waiting_command
+    """Команда /run - виконує shell команду через чергу і повертає результат"""
+    await submit_job(update, context, foreground=True)
+
+
+async def bg_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /bg - фонове завдання зі звітом про завершення"""
+    await submit_job(update, context, foreground=False)
+
+
+async def submit_job(update: Update, context: ContextTypes.DEFAULT_TYPE, foreground: bool):
+    """Ставить команду в чергу завдань"""
+    if not await check_admin(update):
+        return
+    
+    try:
+        options, command = parse_job_command(update.message.text)
+    except ValueError:
+        command = ""
+    if not command:
+        await update.message.reply_text(
+            "❌ Використання: /run або /bg [-p пріоритет] [-t сек] [-m МБ] [-c категорія] команда"
+        )
+        return
     
+    chat_id = update.effective_chat.id
+    
+    async def on_done(job):
+        text = job_report(job)
+        if foreground:
+            output = job.output.strip() or "(вивід відсутній)"
+        else:
+            output = "\n".join(job.output.strip().split("\n")[-20:])
+        if output:
+            # Обрізаємо якщо занадто довгий
+            if len(output) > 3500:
+                output = "... (обрізано)\n" + output[-3500:]
+            text += f"\n```\n{output}\n```"
+        await context.bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+    
+    if foreground:
+        options.setdefault("timeout", RUN_TIMEOUT)
+        options.setdefault("priority", 1)
+    job = jobs.submit(command, on_done=on_done, **options)
+    
+    position = jobs.position(job)
+    status = f"у черзі, позиція {position}" if position else "запущено"
+    await update.message.reply_text(f"⏳ Завдання #{job.id} [{job.category}] {status}: `{command}`",
+                                    parse_mode="Markdown")
+
+
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /jobs - активні і останні завдання"""
     if not await check_admin(update):
         return
     
-    command = update.message.text
-    waiting_command = False
+    active = jobs.active()
+    msg = f"⚙️ Завдання (ліміт {jobs.max_running}"
+    if jobs.category_limits:
+        msg += ", " + ", ".join(f"{k}={v}" for k, v in jobs.category_limits.items())
+    msg += "):\n\n"
+    msg += "\n".join(format_job(job) for job in active) if active else "(активних немає)"
     
-    await update.message.reply_text(f"⏳ Виконую: `{command}`", parse_mode="Markdown")
+    recent = jobs.recent()
+    if recent:
+        msg += "\n\n🕘 Останні завершені:\n" + "\n".join(format_job(job) for job in recent)
+    await update.message.reply_text(msg)
+
+
+async def kill_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /kill <id> - зупиняє завдання"""
+    if not await check_admin(update):
+        return
     
     try:
-        # Виконуємо команду
-        proc = await asyncio.create_subprocess_shell(
-            command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=60)
-        
-        output = ""
-        if stdout:
-            output += stdout.decode('utf-8', errors='replace')
-        if stderr:
-            output += "\n[STDERR]\n" + stderr.decode('utf-8', errors='replace')
-        
-        if not output.strip():
-            output = "(команда виконана, вивід відсутній)"
-        
-        # Обрізаємо якщо занадто довгий
-        if len(output) > 4000:
-            output = output[:4000] + "\n... (обрізано)"
-        
-        await update.message.reply_text(f"```\n{output}\n```", parse_mode="Markdown", reply_markup=get_main_keyboard())
-        
-    except asyncio.TimeoutError:
-        await update.message.reply_text("⏰ Таймаут команди (60 сек)", reply_markup=get_main_keyboard())
-    except Exception as e:
-        await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_main_keyboard())
-
+        job_id = int(context.args[0].lstrip("#"))
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ Використання: /kill <номер завдання>")
+        return
+    
+    if await jobs.kill(job_id):
+        leaked = format_leaked(jobs.jobs[job_id].leaked) if job_id in jobs.jobs else ""
+        await update.message.reply_text(f"⛔ Завдання #{job_id} зупинено{leaked}")
+    else:
+        await update.message.reply_text(f"⭕ Немає активного завдання #{job_id}")
 
-# Глобальний список хендшейків для вибору
-handshake_files: list = []
 
-async def button_handshakes(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Кнопка для показу списку хендшейків"""
-    global handshake_files
+async def every_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /every <інтервал> <команда> - повторювана команда, що звітує тільки про зміни"""
+    if not await check_admin(update):
+        return
+    
+    parts = update.message.text.split(maxsplit=2)
+    if len(parts) < 2:
+        # Без аргументів - список розкладів
+        if not scheduler.schedules:
+            await update.message.reply_text(
+                "🔁 Повторюваних команд немає\n\n"
+                "Використання: /every 5m iw dev\n"
+                "Інтервал: 30s, 5m, 1h, 1d. Зупинити: /unevery N"
+            )
+            return
+        now = asyncio.get_running_loop().time()
+        msg = "🔁 Повторювані команди:\n\n"
+        for sch in scheduler.schedules.values():
+            msg += (f"#{sch.id} кожні {format_interval(sch.interval)}: {sch.command[:60]}\n"
+                    f"   запусків {sch.runs}, змін {sch.changes}, наступний через {max(0, sch.next_run - now):.0f} с\n")
+        await update.message.reply_text(msg)
+        return
+    
+    try:
+        interval = parse_interval(parts[1])
+    except ValueError:
+        interval = 0
+    command = parts[2].strip() if len(parts) > 2 else ""
+    if not interval or not command:
+        await update.message.reply_text("❌ Використання: /every <інтервал> <команда>, наприклад /every 5m iw dev")
+        return
+    
+    chat_id = update.effective_chat.id
+    
+    async def on_change(schedule, job, changed):
+        header = f"🔁 #{schedule.id} `{schedule.command[:100]}`"
+        if job.state != "done":
+            header += f" - {JOB_STATES[job.state]}, код {job.returncode}"
+        if schedule.runs == 1:
+            header += " (перший результат)"
+        body = "\n".join(changed)
+        if len(body) > 3500:
+            body = "... (обрізано)\n" + body[-3500:]
+        text = f"{header}\n```\n{body}\n```" if body else header
+        await context.bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
     
+    try:
+        schedule = scheduler.add(command, interval, on_change)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ Помилка: {e}")
+        return
+    await update.message.reply_text(
+        f"🔁 #{schedule.id}: `{command}` кожні {format_interval(interval)}\n"
+        f"Надсилатиму тільки зміни. Зупинити: /unevery {schedule.id}",
+        parse_mode="Markdown"
+    )
+
+
+async def unevery_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /unevery <N> - зупиняє повторювану команду"""
     if not await check_admin(update):
         return
     
-    # Шукаємо файли хендшейків тільки в /root/
-    handshake_patterns = [
-        "/root/*.cap",
-        "/root/*.pcap", 
-        "/root/*.hccapx",
-        "/root/*.22000",
-    ]
+    try:
+        schedule_id = int(context.args[0].lstrip("#"))
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ Використання: /unevery <номер>")
+        return
     
-    files = []
-    for pattern in handshake_patterns:
-        found = glob.glob(pattern)
-        files.extend(found)
+    if scheduler.remove(schedule_id):
+        schedule_watches.pop(schedule_id, None)
+        await update.message.reply_text(f"🔁 #{schedule_id} зупинено")
+    else:
+        await update.message.reply_text(f"⭕ Немає повторюваної команди #{schedule_id}")
+
+
+WATCH_OPTIONS = {"-l": "level", "-s": "scope"}
+
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /watch [-l рівень] [-s область] [-q] <текст> - сповіщення про рядок у виводі"""
+    if not await check_admin(update):
+        return
     
-    # Видаляємо дублікати і директорії
-    files = list(set([f for f in files if os.path.isfile(f)]))
-    files.sort(key=os.path.getmtime, reverse=True)  # Сортуємо по даті
+    # Шаблон - решта повідомлення як є, з усіма пробілами всередині
+    parts = update.message.text.split(maxsplit=1)
+    rest = parts[1] if len(parts) > 1 else ""
+    if not rest:
+        if not watchset.rules:
+            await update.message.reply_text(
+                "👁 Правил спостереження немає\n\n"
+                "Використання: /watch WPA handshake:\n"
+                f"-l рівень ({', '.join(LEVELS)}), -s область ({', '.join(SCOPES)}), -q - без звуку\n"
+                "Видалити: /unwatch N"
+            )
+            return
+        msg = "👁 Правила спостереження:\n\n"
+        for rule in watchset.rules.values():
+            sound = "" if rule.sound else " 🔕"
+            msg += f"#{rule.id} {LEVELS[rule.level]} [{rule.scope}] {rule.pattern}{sound}\n"
+        await update.message.reply_text(msg)
+        return
     
-    if not files:
+    options = {"level": "high", "scope": "all", "sound": True}
+    # split(maxsplit=1) зберігає пробіли всередині решти тексту
+    while rest.startswith("-"):
+        flag, rest = (rest.split(maxsplit=1) + [""])[:2]
+        if flag == "-q":
+            options["sound"] = False
+        elif flag in WATCH_OPTIONS and rest:
+            value, rest = (rest.split(maxsplit=1) + [""])[:2]
+            options[WATCH_OPTIONS[flag]] = value.lower()
+        else:
+            rest = ""
+    pattern = rest
+    if not pattern or options["level"] not in LEVELS or options["scope"] not in SCOPES:
         await update.message.reply_text(
-            "📭 Хендшейки не знайдено в /root/",
-            reply_markup=get_main_keyboard()
+            "❌ Використання: /watch [-l high|normal|low] [-s "
+            + "|".join(SCOPES) + "] [-q] <текст>"
         )
         return
     
-    # Зберігаємо список для подальшого вибору
-    handshake_files = files[:20]
+    # Шаблон - підрядок без урахування регістру
+    watch_id = history.add_watch(options["scope"], pattern, options["level"], options["sound"])
+    watchset.add(WatchRule(watch_id, options["scope"], pattern, options["level"], options["sound"]))
+    await update.message.reply_text(f"👁 #{watch_id} {LEVELS[options['level']]} [{options['scope']}] {pattern}")
+
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /unwatch <N> - видаляє правило спостереження"""
+    if not await check_admin(update):
+        return
     
-    # Показуємо список файлів
-    msg = f"📦 Знайдено {len(files)} файл(ів):\n\n"
-    for i, f in enumerate(handshake_files, 1):
-        size = os.path.getsize(f)
-        size_str = f"{size} B" if size < 1024 else f"{size//1024} KB"
-        mtime = datetime.fromtimestamp(os.path.getmtime(f))
-        date_str = mtime.strftime("%d.%m.%Y %H:%M")
-        msg += f"{i}. `{os.path.basename(f)}`\n   📅 {date_str} | 💾 {size_str}\n\n"
+    try:
+        watch_id = int(context.args[0].lstrip("#"))
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ Використання: /unwatch <номер>")
+        return
     
-    msg += "📥 Введи номер файлу для скачування\nабо 0 для виходу"
-    await update.message.reply_text(msg, parse_mode="Markdown", reply_markup=get_handshake_keyboard())
+    if watchset.remove(watch_id):
+        history.remove_watch(watch_id)
+        await update.message.reply_text(f"👁 #{watch_id} видалено")
+    else:
+        await update.message.reply_text(f"⭕ Немає правила #{watch_id}")
 
 
-def get_handshake_keyboard():
-    """Клавіатура для вибору хендшейків"""
-    keyboard = [["🔙 Назад"]]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+# Перегляд хендшейків: знімок списку в пам'яті і ім'я вузла, з якого його отримано
+capture_index: Optional[CaptureIndex] = None
+capture_node_name = LOCAL_NODE
+
+SORT_LABELS = {"date": "📅 Дата", "size": "💾 Розмір", "name": "🔤 Ім'я"}
 
 
-async def handle_handshake_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обробка вибору номера хендшейку"""
-    global handshake_files
+async def build_capture_index(node, query: str = "", previous: Optional[CaptureIndex] = None):
+    """Читає список захоплень один раз; далі сторінки рахуються з пам'яті"""
+    global capture_index, capture_node_name
+    files = await list_captures(node)
+    index = CaptureIndex(files, CAPTURES_PAGE_SIZE)
+    if previous:
+        index.set_filter(previous.sort, previous.ext, previous.query)
+    if query:
+        index.set_filter(query=query)
+    capture_index = index
+    capture_node_name = node.name if node else LOCAL_NODE
+    return index
+
+
+def capture_browser_node():
+    """Вузол перегляду за ім'ям - шукаємо щоразу, бо він міг відключитись"""
+    if capture_node_name == LOCAL_NODE:
+        return None
+    node = hub.get(capture_node_name) if hub else None
+    if node is None:
+        raise RemoteError(f"вузол {capture_node_name} відключився")
+    return node
+
+
+def render_capture_page(index: CaptureIndex):
+    """Текст і inline-клавіатура поточної сторінки"""
+    view = index.view()
+    filters_line = f"Сортування: {SORT_LABELS[index.sort]} | Тип: {index.ext or 'всі'}"
+    if index.query:
+        filters_line += f" | Пошук: {index.query}"
+    text = (f"📦 Хендшейки (вузол: {capture_node_name}): {len(view)} з {len(index.files)}\n"
+            f"{filters_line}\nСторінка {index.page + 1}/{index.pages}\n\n")
+    
+    data = lambda action, arg="": f"hs:{index.id}:{action}:{arg}"
+    rows = []
+    start = index.page * index.page_size
+    for n, (i, f) in enumerate(index.page_items(), start + 1):
+        text += f"{n}. {f.name}\n   📅 {format_mtime(f.mtime)} | 💾 {format_size(f.size)}"
+        text += f" | 📶 {f.essid}\n" if f.essid else "\n"
+        rows.append([InlineKeyboardButton(f"📥 {n}. {f.name[:40]}", callback_data=data("g", i))])
+    if not view:
+        text += "📭 Нічого не знайдено за цими фільтрами\n"
     
+    rows.append([
+        InlineKeyboardButton("◀️", callback_data=data("p", index.page - 1)),
+        InlineKeyboardButton(f"{index.page + 1}/{index.pages}", callback_data=data("n")),
+        InlineKeyboardButton("▶️", callback_data=data("p", index.page + 1)),
+    ])
+    rows.append([
+        InlineKeyboardButton(("✓ " if key == index.sort else "") + label, callback_data=data("s", key))
+        for key, label in SORT_LABELS.items()
+    ])
+    rows.append([InlineKeyboardButton(("✓ " if index.ext is None else "") + "Всі", callback_data=data("e"))] + [
+        InlineKeyboardButton(("✓ " if ext == index.ext else "") + ext, callback_data=data("e", ext))
+        for ext in index.extensions()
+    ])
+    if any(index.files[i].path.endswith(MERGE_EXTENSIONS) for i in view):
+        rows.append([InlineKeyboardButton("🧩 Об'єднати", callback_data=data("m")),
+                     InlineKeyboardButton("🧩 Тільки хендшейки", callback_data=data("m", "h"))])
+    last = [InlineKeyboardButton("🔄 Оновити", callback_data=data("r")),
+            InlineKeyboardButton("❌ Закрити", callback_data=data("x"))]
+    if index.query:
+        last.insert(0, InlineKeyboardButton("✖ Пошук", callback_data=data("q")))
+    rows.append(last)
+    return text, InlineKeyboardMarkup(rows)
+
+
+async def open_capture_browser(update: Update, query: str = ""):
     if not await check_admin(update):
         return
     
-    text = update.message.text.strip()
+    try:
+        node = get_selected_node()
+        index = await build_capture_index(node, query)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_main_keyboard())
+        return
     
-    # Перевіряємо чи це номер
-    if not text.isdigit():
-        return False
+    if not index.files:
+        await update.message.reply_text(
+            f"📭 Хендшейки не знайдено в /root/ (вузол: {selected_node})",
+            reply_markup=get_main_keyboard()
+        )
+        return
     
-    num = int(text)
+    text, markup = render_capture_page(index)
+    await update.message.reply_text(text, reply_markup=markup)
+
+
+async def button_handshakes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка перегляду хендшейків"""
+    await open_capture_browser(update)
+
+
+async def captures_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /captures [текст] - хендшейки з фільтром за ім'ям файлу або ESSID"""
+    await open_capture_browser(update, " ".join(context.args))
+
+
+async def capture_browser_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Натискання inline-кнопок перегляду хендшейків - редагує те саме повідомлення"""
+    query = update.callback_query
+    if not await check_admin(update):
+        return
     
-    # 0 = вихід
-    if num == 0:
-        handshake_files = []
-        await update.message.reply_text("🏠 Головне меню", reply_markup=get_main_keyboard())
-        return True
+    _, index_id, action, arg = query.data.split(":", 3)
+    index = capture_index
+    if index is None or str(index.id) != index_id:
+        await query.answer("Список застарів - відкрий 📦 Хендшейки ще раз", show_alert=True)
+        return
     
-    # Перевіряємо чи є список
-    if not handshake_files:
-        return False
+    node = None
+    if action in ("g", "m", "r"):
+        try:
+            node = capture_browser_node()
+        except RemoteError as e:
+            await query.answer(f"❌ {e}", show_alert=True)
+            return
     
-    # Перевіряємо діапазон
-    if num < 1 or num > len(handshake_files):
-        await update.message.reply_text(f"❌ Невірний номер. Введи від 1 до {len(handshake_files)}", reply_markup=get_handshake_keyboard())
-        return True
+    if action == "g":
+        f = index.get(int(arg))
+        if f is None:
+            await query.answer("Файл не знайдено", show_alert=True)
+            return
+        await query.answer(f"📥 {f.name}")
+        # Відправляємо файл у фоні - завантаження не тримає чергу чату
+        run_in_background(send_handshake(context.bot, query.message.chat_id, f, node))
+        return
+    if action == "m":
+        files = [index.files[i] for i in index.view() if index.files[i].path.endswith(MERGE_EXTENSIONS)]
+        await query.answer(f"🧩 Об'єдную {len(files)} файл(ів)...")
+        run_in_background(send_merged(context.bot, query.message.chat_id, files, node, arg == "h"))
+        return
+    if action == "x":
+        await query.answer()
+        await query.edit_message_text("📦 Перегляд хендшейків закрито")
+        return
     
-    # Відправляємо файл
-    f = handshake_files[num - 1]
     try:
-        mtime = datetime.fromtimestamp(os.path.getmtime(f))
-        date_str = mtime.strftime("%d.%m.%Y %H:%M")
-        size = os.path.getsize(f)
-        size_str = f"{size} B" if size < 1024 else f"{size//1024} KB"
-        with open(f, 'rb') as file:
-            await update.message.reply_document(
-                document=file,
-                filename=os.path.basename(f),
-                caption=f"📁 {os.path.basename(f)}\n📅 {date_str}\n💾 {size_str}"
-            )
-        await update.message.reply_text("✅ Надіслано!\n\nВведи ще номер або 0 для виходу", reply_markup=get_handshake_keyboard())
+        if action == "p":
+            index.set_page(int(arg))
+        elif action == "s":
+            index.set_filter(sort=arg)
+        elif action == "e":
+            index.set_filter(ext=arg or None)
+        elif action == "q":
+            index.set_filter(query="")
+        elif action == "r":
+            index = await build_capture_index(node, previous=index)
     except Exception as e:
-        await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_handshake_keyboard())
+        await query.answer(f"❌ {e}", show_alert=True)
+        return
     
-    return True
+    await query.answer()
+    text, markup = render_capture_page(index)
+    try:
+        await query.edit_message_text(text, reply_markup=markup)
+    except BadRequest as e:
+        # Та сама сторінка (напр. "◀️" на першій) - редагувати нічого
+        if "not modified" not in str(e):
+            raise
+
+
+async def send_merged(bot, chat_id: int, files: list, node, handshake_only: bool):
+    """Об'єднує файли захоплення (на вузлі, якщо вони там) і надсилає один файл"""
+    paths = [f.path for f in files]
+    try:
+        with tempfile.TemporaryFile() as file:
+            if node:
+                stats = await node.merge(paths, file, handshake_only)
+            else:
+                stats = (await asyncio.to_thread(merge_captures, paths, file, handshake_only)).as_dict()
+            size = file.tell()
+            if not stats["written"]:
+                await bot.send_message(chat_id, "📭 Після об'єднання не лишилось жодного кадру")
+                return
+            if size > MAX_UPLOAD:
+                await bot.send_message(chat_id, f"❌ Результат завеликий для Telegram: {format_size(size)}")
+                return
+            
+            caption = (f"🧩 {stats['files']} файл(ів) -> {format_size(size)}\n"
+                       f"Кадрів: {stats['written']} з {stats['read']}, дублікатів: {stats['duplicates']}")
+            if handshake_only:
+                caption += f", відфільтровано: {stats['filtered']}"
+            if stats["errors"]:
+                caption += f"\n⚠️ Пропущено/обрізано файлів: {len(stats['errors'])}"
+            ext = "cap" if stats["format"] == "pcap" else "pcapng"
+            file.seek(0)
+            await bot.send_document(chat_id, document=file, caption=caption,
+                                    filename=f"merged-{datetime.now():%Y%m%d-%H%M%S}.{ext}")
+    except Exception as e:
+        await bot.send_message(chat_id, f"❌ Помилка об'єднання: {e}")
+
+
+async def send_handshake(bot, chat_id: int, f, node):
+    """Надсилає файл хендшейку в чат"""
+    try:
+        caption = f"📁 {f.name}\n📅 {format_mtime(f.mtime)}\n💾 {format_size(f.size)}"
+        if node:
+            # Файл з вузла потоково приходить у тимчасовий файл
+            with tempfile.TemporaryFile() as file:
+                await node.fetch(f.path, file)
+                file.seek(0)
+                await bot.send_document(chat_id, document=file, filename=f.name, caption=caption)
+        else:
+            with open(f.path, 'rb') as file:
+                await bot.send_document(chat_id, document=file, filename=f.name, caption=caption)
+    except Exception as e:
+        await bot.send_message(chat_id, f"❌ Помилка: {e}")
 
 
 async def button_airgeddon(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -375,165 +1051,419 @@ async def button_stop_program(update: Update, context: ContextTypes.DEFAULT_TYPE
     if not await check_admin(update):
         return
     
-    if active_process and active_process.returncode is None:
+    proc = active_process
+    if proc and proc.returncode is None:
         try:
-            active_process.terminate()
-            await asyncio.sleep(1)
-            if active_process.returncode is None:
-                active_process.kill()
-            await update.message.reply_text("🛑 Програму зупинено", reply_markup=get_main_keyboard())
+            report = await stop_process(proc)
+            await update.message.reply_text(
+                f"🛑 Програму зупинено (останній сигнал: {report.signal}){format_leaked(report.leaked)}",
+                reply_markup=get_main_keyboard()
+            )
         except Exception as e:
             await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_main_keyboard())
     else:
         await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_main_keyboard())
 
 
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /history [N] - останні запуски"""
+    if not await check_admin(update):
+        return
+    
+    try:
+        limit = min(int(context.args[0]), 50) if context.args else 10
+    except ValueError:
+        await update.message.reply_text("❌ Використання: /history [кількість]")
+        return
+    
+    rows = await asyncio.to_thread(history.recent_runs, limit)
+    if not rows:
+        await update.message.reply_text("📭 Історія порожня")
+        return
+    
+    msg = f"📜 Останні {len(rows)} запуск(ів):\n\n"
+    for started, kind, node, command, duration, exit_code, bytes_out in rows:
+        date_str = datetime.fromtimestamp(started).strftime("%d.%m %H:%M:%S")
+        if duration is None:
+            result = "⏳ виконується"
+        else:
+            result = f"⏱ {duration:.1f}s | код {exit_code if exit_code is not None else '?'}"
+        msg += f"{date_str} [{kind}@{node}] {command[:60]}\n   {result} | 💾 {format_size(bytes_out)}\n"
+    
+    if len(msg) > 4000:
+        msg = msg[:4000]
+    await update.message.reply_text(msg)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /stats [днів] - зведена статистика"""
+    if not await check_admin(update):
+        return
+    
+    try:
+        days = float(context.args[0]) if context.args else 0
+    except ValueError:
+        await update.message.reply_text("❌ Використання: /stats [днів]")
+        return
+    
+    since = time.time() - days * 86400 if days else 0
+    stats = await asyncio.to_thread(history.stats, since)
+    
+    period = f"за {days:g} дн." if days else "за весь час"
+    msg = f"📈 Статистика {period}:\n\n"
+    for kind, count, ok, avg_duration, total_bytes in stats["by_kind"]:
+        avg_str = f"{avg_duration:.1f}s" if avg_duration is not None else "-"
+        msg += f"• {kind}: {count} запуск(ів), успішних {ok or 0}, середня тривалість {avg_str}, вивід {format_size(total_bytes)}\n"
+    if not stats["by_kind"]:
+        msg += "(запусків немає)\n"
+    
+    if stats["top"]:
+        msg += "\n🔝 Найчастіші команди:\n"
+        for command, count in stats["top"]:
+            msg += f"{count}× {command[:60]}\n"
+    
+    captures_count, captures_size = stats["captures"]
+    msg += f"\n📦 Нових хендшейків: {captures_count} ({format_size(captures_size)})"
+    await update.message.reply_text(msg)
+
+
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /trace - перцентилі затримок від натискання до виводу"""
+    if not await check_admin(update):
+        return
+    
+    summary = tracer.summary()
+    if not summary:
+        await update.message.reply_text("📭 Трас ще немає - натисни кілька кнопок в Airgeddon")
+        return
+    
+    descriptions = {
+        "delivery": "Telegram -> бот",
+        "queue": "черга оновлень",
+        "stdin": "обробник + stdin",
+        "reaction": "реакція програми",
+        "send": "відправка виводу",
+        "total": "загалом",
+    }
+    msg = f"⏱ Затримки, мс (трас: {len(tracer.completed)}, очікують: {len(tracer.pending)})\n"
+    msg += "відрізок: n | p50 | p90 | p99 | max\n\n"
+    for name, _, _ in SPANS:
+        if name in summary:
+            count, p50, p90, p99, worst = summary[name]
+            msg += (f"{descriptions[name]}: {count} | {p50 * 1000:.0f} | {p90 * 1000:.0f} | "
+                    f"{p99 * 1000:.0f} | {worst * 1000:.0f}\n")
+    lag = loop_watchdog.summary()
+    if lag:
+        _, p50, p99, worst = lag
+        msg += (f"\nevent loop: p50 {p50 * 1000:.0f} | p99 {p99 * 1000:.0f} | max {worst * 1000:.0f}, "
+                f"зависань: {loop_watchdog.stall_count} (/lag)\n")
+    await update.message.reply_text(msg)
+
+
+async def http_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /http - статистика пулів з'єднань до Bot API"""
+    if not await check_admin(update):
+        return
+    
+    msg = "🌐 Пули HTTP (з'єднань | зараз/пік | запитів | помилок/таймаутів | сер./макс., мс)\n\n"
+    for pool in http_pools:
+        stats = pool.stats
+        connections = pool.connections()
+        avg = stats.busy_time / stats.requests * 1000 if stats.requests else 0
+        msg += (f"{pool.name}: {'?' if connections is None else connections}/{pool.pool_size} | "
+                f"{stats.in_flight}/{stats.peak} | {stats.requests} | {stats.errors}/{stats.timeouts} | "
+                f"{avg:.0f}/{stats.slowest * 1000:.0f}\n")
+        if stats.last_method:
+            msg += f"   останній: {stats.last_method}\n"
+    await update.message.reply_text(msg)
+
+
+def buffer_sizes() -> list:
+    """[(назва, опис)] власних буферів і реєстрів бота"""
+    job_list = list(jobs.jobs.values())
+    output_size = sum(job.output_buffer.size for job in job_list)
+    output_lines = sum(len(job.output_buffer.lines) for job in job_list)
+    schedule_size = sum(len(s.last_output or "") for s in scheduler.schedules.values())
+    result = [
+        ("завдання", f"{len(job_list)}, вивід {format_size(output_size)} ({output_lines} рядків)"),
+        ("повторювані", f"{len(scheduler.schedules)}, останній вивід {format_size(schedule_size)}"),
+        ("сесії наглядача", str(len(supervisor.sessions))),
+        ("замки stdin", str(len(session_locks))),
+        ("фонові задачі", str(len(background_tasks))),
+        ("черга історії", str(history.pending)),
+        ("траси", f"{len(tracer.completed)} + {len(tracer.pending)} очікують"),
+        ("зависання loop", f"{len(loop_watchdog.stalls)}, вимірів {len(loop_watchdog.samples)}"),
+        ("правила /watch", f"{len(watchset.rules)}, потоків завдань {len(job_watches)}, розкладів {len(schedule_watches)}"),
+        ("хендшейки в пам'яті", str(len(capture_index.files) if capture_index else 0)),
+    ]
+    if hub:
+        nodes = list(hub.nodes.values())
+        result.append(("вузли", f"{len(nodes)}, процесів {sum(len(n.processes) for n in nodes)}"))
+    return result
+
+
+async def mem_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /mem [on [кадрів] | off | snap | top] - пам'ять, задачі asyncio і буфери"""
+    if not await check_admin(update):
+        return
+    
+    action = context.args[0].lower() if context.args else ""
+    if action == "on":
+        try:
+            # Без аргументу - поточна глибина, якщо трасування вже працює
+            frames = int(context.args[1]) if len(context.args) > 1 else (memory.frames if memory.enabled else 10)
+        except ValueError:
+            frames = 0
+        if frames < 1:
+            await update.message.reply_text("❌ Використання: /mem on [глибина стеку, від 1]")
+            return
+        was_on = memory.enabled
+        if memory.start(frames):
+            text = f"🧠 tracemalloc перезапущено з глибиною {frames} (зібрані дані скинуто)"
+        elif was_on:
+            text = f"🧠 tracemalloc вже увімкнено (глибина {frames}), порівняння починається заново"
+        else:
+            text = f"🧠 tracemalloc увімкнено (глибина {frames})"
+        await update.message.reply_text(f"{text}. /mem snap - знімок")
+        return
+    if action == "off":
+        memory.stop()
+        await update.message.reply_text("🧠 tracemalloc вимкнено")
+        return
+    if action in ("snap", "top"):
+        if not memory.enabled:
+            await update.message.reply_text("⭕ tracemalloc вимкнено - спочатку /mem on")
+            return
+        top, diff = await asyncio.to_thread(memory.snapshot)
+        if action == "snap" and diff is not None:
+            msg = "🧠 Зміни з попереднього знімка:\n\n"
+            for stat in diff:
+                msg += f"{format_site(stat)}: {stat.size_diff / 1024:+.1f} KB ({stat.count_diff:+d})\n"
+            if not diff:
+                msg += "(без змін)\n"
+        else:
+            msg = "🧠 Найбільші місця виділення:\n\n"
+            for stat in top:
+                msg += f"{format_site(stat)}: {stat.size / 1024:.1f} KB ({stat.count})\n"
+            if action == "snap":
+                msg += "\nЦе перший знімок - наступний /mem snap покаже різницю"
+        await update.message.reply_text(msg[:4000])
+        return
+    if action:
+        await update.message.reply_text("❌ Використання: /mem [on [кадрів] | off | snap | top]")
+        return
+    
+    rss = rss_bytes()
+    msg = f"🧠 RSS: {format_size(rss) if rss is not None else '?'}\n"
+    if memory.enabled:
+        current, peak = memory.traced()
+        msg += f"tracemalloc: {format_size(current)} (пік {format_size(peak)})\n"
+    else:
+        msg += "tracemalloc: вимкнено (/mem on)\n"
+    
+    counts = task_counts()
+    msg += f"\n⚙️ Задачі asyncio: {sum(count for _, count in counts)}\n"
+    for name, count in counts[:10]:
+        msg += f"{count}× {name}\n"
+    
+    msg += "\n📦 Буфери:\n"
+    for name, value in buffer_sizes():
+        msg += f"{name}: {value}\n"
+    await update.message.reply_text(msg)
+
+
+async def lag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /lag - затримка event loop і стеки найгірших зависань"""
+    if not await check_admin(update):
+        return
+    
+    lag = loop_watchdog.summary()
+    if not lag:
+        await update.message.reply_text("📭 Вимірів ще немає")
+        return
+    
+    count, p50, p99, worst = lag
+    msg = (f"🐢 Lag event loop, мс (вимірів: {count}): p50 {p50 * 1000:.0f} | "
+           f"p99 {p99 * 1000:.0f} | max {worst * 1000:.0f}\n"
+           f"Зависань > {loop_watchdog.threshold * 1000:.0f} мс: {loop_watchdog.stall_count}\n")
+    
+    offenders = loop_watchdog.offenders()
+    if offenders:
+        msg += "\n🔝 Хто блокує (разів | сумарно | max, мс):\n"
+        for o in offenders:
+            msg += f"{o.where}: {o.count} | {o.total * 1000:.0f} | {o.worst * 1000:.0f}\n"
+    
+    for stall in loop_watchdog.worst(3):
+        msg += f"\n⏸ {stall.when}, {stall.lag * 1000:.0f} мс:\n{stall.format_stack()}"
+    await update.message.reply_text(msg[:4000])
+
+
+# Дії, що виконуються одразу, без черги чату
+FREE_BUTTONS = {"🛑 Stop Program", "📊 Status"}
+FREE_COMMANDS = {"/trace", "/lag", "/http", "/mem", "/jobs", "/kill", "/history", "/stats"}
+
+
+def is_free_update(update: Update) -> bool:
+    """Чи можна обробити оновлення поза чергою чату"""
+    text = update.message.text if update.message and update.message.text else ""
+    if text in FREE_BUTTONS:
+        return True
+    command = text.split(maxsplit=1)[0].split("@")[0] if text.startswith("/") else ""
+    return command in FREE_COMMANDS
+
+
+async def button_nodes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка списку вузлів"""
+    if not await check_admin(update):
+        return
+    
+    if not hub:
+        await update.message.reply_text("🖧 Hub-режим вимкнено (HUB_PORT не заданий)", reply_markup=get_main_keyboard())
+        return
+    
+    msg = f"🖧 Вузли (вибрано: {selected_node}):\n\n• {LOCAL_NODE}\n"
+    for name, node in sorted(hub.nodes.items()):
+        msg += f"• {name} - процесів: {len(node.processes)}\n"
+    await update.message.reply_text(msg, reply_markup=get_nodes_keyboard())
+
+
+async def button_select_node(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Вибір вузла кнопкою '🖧 <ім'я>'"""
+    global selected_node
+    
+    if not await check_admin(update):
+        return
+    
+    name = update.message.text.removeprefix("🖧 ").strip()
+    if active_process and active_process.returncode is None:
+        await update.message.reply_text("⚠️ Спочатку зупини програму", reply_markup=get_airgeddon_keyboard())
+        return
+    if name != LOCAL_NODE and not (hub and hub.get(name)):
+        await update.message.reply_text(f"❌ Вузол '{name}' не підключений", reply_markup=get_nodes_keyboard())
+        return
+    
+    selected_node = name
+    await update.message.reply_text(f"✅ Вибрано вузол: {name}", reply_markup=get_main_keyboard())
+
+
 async def button_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Кнопка статусу"""
     if not await check_admin(update):
         return
     
+    # Нащадки завершених сесій, що досі живі (напр. сервер tmux)
+    orphans = await asyncio.to_thread(supervisor.orphans)
+    leftover = ""
+    if orphans:
+        leftover = "\n⚠️ Залишкові процеси: " + ", ".join(
+            f"{info.pid} ({info.comm}, {name})" for name, info in orphans)
+    
     if active_process and active_process.returncode is None:
         await update.message.reply_text(
-            f"✅ Процес активний\nPID: {active_process.pid}",
+            f"✅ Процес активний\nВузол: {selected_node}\nPID: {active_process.pid}{leftover}",
             reply_markup=get_airgeddon_keyboard()
         )
     else:
-        await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_main_keyboard())
+        await update.message.reply_text(f"⭕ Немає активного процесу{leftover}", reply_markup=get_main_keyboard())
 
 
 async def button_enter(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Кнопка Enter"""
+    trace = tracer.start(update, "enter")
     if not await check_admin(update):
         return
     
-    if active_process and active_process.returncode is None:
-        try:
-            active_process.stdin.write(b"enter\n")
-            await active_process.stdin.drain()
-            await update.message.reply_text("⏎ Enter відправлено\n⏳ Зачекай 3 сек...", reply_markup=get_airgeddon_keyboard())
-        except Exception as e:
-            await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_airgeddon_keyboard())
-    else:
-        await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_main_keyboard())
+    await send_keys(update, ["enter"], trace)
 
 
 async def button_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Кнопка оновлення"""
-    global command_output
-    
     if not await check_admin(update):
         return
     
-    # Режим командного рядка
+    # Режим командного рядка - тільки нові рядки з попереднього оновлення
     if waiting_command:
-        if command_output:
-            output = command_output
-            # Беремо останні 60 рядків
-            lines = output.strip().split('\n')
-            if len(lines) > 60:
-                output = '\n'.join(lines[-60:])
-                output = f"...(показано останні 60 рядків)\n{output}"
-            if len(output) > 4000:
-                output = output[-4000:]
-            await update.message.reply_text(f"📤 Останній вивід:\n```\n{output}\n```", 
+        if not command_job:
+            await update.message.reply_text("📭 Немає збереженого виводу", reply_markup=get_command_keyboard())
+            return
+        new_output = format_new_output(command_job, update.effective_user.id, 60)
+        if new_output:
+            await update.message.reply_text(f"📤 Новий вивід:\n{new_output}",
                                            parse_mode='Markdown',
                                            reply_markup=get_command_keyboard())
         else:
-            await update.message.reply_text("📭 Немає збереженого виводу", reply_markup=get_command_keyboard())
+            await update.message.reply_text(
+                f"📭 Нового виводу немає (всього рядків: {command_job.output_buffer.total})\n"
+                "📜 Хвіст - показати останні рядки",
+                reply_markup=get_command_keyboard()
+            )
         return
     
-    # Режим airgeddon
-    if active_process and active_process.returncode is None:
-        try:
-            active_process.stdin.write(b"refresh\n")
-            await active_process.stdin.drain()
-            await update.message.reply_text("🔄 Оновлення...", reply_markup=get_airgeddon_keyboard())
-        except Exception as e:
-            await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_airgeddon_keyboard())
-    else:
-        await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_main_keyboard())
+    # Режим airgeddon - через пакет вводу, щоб не обігнати вже натиснуті клавіші
+    await send_keys(update, ["refresh"], immediate=True)
+
+
+async def button_tail(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка Хвіст - останні 60 рядків виводу незалежно від курсора"""
+    if not await check_admin(update):
+        return
+    
+    if not command_job or not command_job.output_buffer.total:
+        await update.message.reply_text("📭 Немає збереженого виводу", reply_markup=get_command_keyboard())
+        return
+    
+    output = "".join(command_job.output_buffer.tail(60)).strip()
+    if len(output) > 4000:
+        output = output[-4000:]
+    # Хвіст теж вважається переглянутим
+    command_job.output_buffer.cursors[update.effective_user.id] = command_job.output_buffer.total
+    await update.message.reply_text(f"📜 Останні рядки:\n```\n{output}\n```",
+                                   parse_mode='Markdown',
+                                   reply_markup=get_command_keyboard())
+
+
+async def kill_command_job(job, message, viewer_id: int):
+    """Зупиняє завдання командного рядка і показує вивід, якого глядач ще не бачив"""
+    try:
+        # SIGINT -> SIGTERM -> SIGKILL всьому дереву процесів
+        await jobs.kill(job.id)
+        
+        new_output = format_new_output(job, viewer_id, 30)
+        if new_output:
+            await message.reply_text(f"⛔ Процес зупинено\n\n📤 Новий вивід:\n{new_output}",
+                                     parse_mode='Markdown',
+                                     reply_markup=get_command_keyboard())
+        else:
+            await message.reply_text("⛔ Процес зупинено", reply_markup=get_command_keyboard())
+    except Exception as e:
+        await message.reply_text(f"❌ Помилка: {e}", reply_markup=get_command_keyboard())
 
 
 async def button_ctrlc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Кнопка Ctrl+C"""
-    global command_process, command_output
-    
     if not await check_admin(update):
         return
     
     # Режим командного рядка
     if waiting_command:
-        if command_process and command_process.returncode is None:
-            try:
-                import signal
-                import os as os_module
-                # Відправляємо SIGTERM всій групі процесів
-                os_module.killpg(os_module.getpgid(command_process.pid), signal.SIGTERM)
-                await asyncio.sleep(0.5)
-                # Якщо ще працює - SIGKILL
-                if command_process.returncode is None:
-                    os_module.killpg(os_module.getpgid(command_process.pid), signal.SIGKILL)
-                
-                # Показуємо останній вивід
-                if command_output:
-                    output = command_output
-                    lines = output.strip().split('\n')
-                    if len(lines) > 30:
-                        output = '\n'.join(lines[-30:])
-                    if len(output) > 3000:
-                        output = output[-3000:]
-                    await update.message.reply_text(f"⛔ Процес зупинено\n\n📤 Останній вивід:\n```\n{output}\n```", 
-                                                   parse_mode='Markdown',
-                                                   reply_markup=get_command_keyboard())
-                else:
-                    await update.message.reply_text("⛔ Процес зупинено", reply_markup=get_command_keyboard())
-            except Exception as e:
-                # Якщо killpg не працює - просто terminate
-                try:
-                    command_process.terminate()
-                    await update.message.reply_text("⛔ Процес зупинено", reply_markup=get_command_keyboard())
-                except:
-                    await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_command_keyboard())
+        if command_job and command_job.state in ("queued", "running"):
+            # Ескалація сигналів триває до кількох секунд - не тримаємо чергу чату
+            run_in_background(kill_command_job(command_job, update.message, update.effective_user.id))
         else:
             await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_command_keyboard())
         return
     
-    # Режим airgeddon
-    if active_process and active_process.returncode is None:
-        try:
-            active_process.stdin.write(b"ctrlc\n")
-            await active_process.stdin.drain()
-            await update.message.reply_text("⛔ Ctrl+C відправлено\n⏳ Зачекай 2 сек...", reply_markup=get_airgeddon_keyboard())
-        except Exception as e:
-            await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_airgeddon_keyboard())
-    else:
-        await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_main_keyboard())
+    # Режим airgeddon - без очікування пакета, але після вже натиснутих клавіш
+    await send_keys(update, ["ctrlc"], immediate=True)
 
 
 async def button_digit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробка цифрових кнопок"""
-    global handshake_files
-    
+    trace = tracer.start(update, "digit")
     if not await check_admin(update):
         return
     
-    digit = update.message.text
-    
-    # Якщо режим вибору хендшейків - передаємо туди
-    if handshake_files:
-        await handle_handshake_selection(update, context)
-        return
-    
-    if active_process and active_process.returncode is None:
-        try:
-            active_process.stdin.write(f"{digit}\n".encode())
-            await active_process.stdin.drain()
-            await update.message.reply_text(f"📤 Відправлено: {digit}\n⏳ Зачекай 3 сек...", reply_markup=get_airgeddon_keyboard())
-        except Exception as e:
-            await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_airgeddon_keyboard())
-    else:
-        await update.message.reply_text("⭕ Немає активного процесу", reply_markup=get_main_keyboard())
+    await send_keys(update, [update.message.text], trace)
 
 
 async def button_manual_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -556,27 +1486,24 @@ async def button_manual_input(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def button_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Кнопка Назад - повернення в головне меню"""
-    global waiting_command, handshake_files, command_process
+    global waiting_command
     
     if not await check_admin(update):
         return
     
-    # Зупиняємо процес якщо є
-    if command_process and command_process.returncode is None:
-        try:
-            command_process.terminate()
-        except:
-            pass
+    # Зупиняємо процес якщо є - у фоні, щоб не тримати чергу чату
+    if command_job and command_job.state in ("queued", "running"):
+        run_in_background(jobs.kill(command_job.id))
     
     waiting_command = False
-    handshake_files = []
     await update.message.reply_text("🏠 Головне меню", reply_markup=get_main_keyboard())
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробка будь-якого тексту - відправляє в процес або виконує команду"""
-    global waiting_manual_input, waiting_command, handshake_files
+    global waiting_manual_input, waiting_command
     
+    trace = tracer.start(update, "text")
     if not await check_admin(update):
         return
     
@@ -585,92 +1512,104 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Ігноруємо якщо це кнопка
     buttons = ["🚀 Start Program", "📡 Airgeddon", "🛑 Stop Program", "📊 Status", 
                "⏎ Enter", "🔄 Оновити", "✍️ Ввід", "⛔ Ctrl+C", "📦 Хендшейки", "🔙 Назад",
-               "🔄 Оновити", "⛔ Ctrl+C"]
-    if text in buttons:
+               "🔄 Оновити", "⛔ Ctrl+C", "🖧 Вузли", "📜 Хвіст"]
+    if text in buttons or text.startswith("🖧 "):
         return
     
-    # Режим вибору хендшейка (перевіряємо ПЕРШИМ!)
-    if handshake_files:
-        if text.isdigit():
-            handled = await handle_handshake_selection(update, context)
-            if handled:
-                return
-        else:
-            await update.message.reply_text("❌ Введи номер файлу або 0 для виходу", reply_markup=get_handshake_keyboard())
-            return
-    
     # Режим командного рядка
     if waiting_command:
-        global command_process, command_output
-        try:
-            await update.message.reply_text(f"⏳ Виконую: `{text}`\n\nНатисни 🔄 Оновити щоб побачити вивід\n⛔ Ctrl+C щоб зупинити", 
-                                           parse_mode='Markdown', reply_markup=get_command_keyboard())
-            
-            import os as os_module
-            # Виконуємо команду в новій групі процесів для можливості зупинки
-            command_process = await asyncio.create_subprocess_shell(
-                text,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT,
-                preexec_fn=os_module.setsid  # Створюємо нову групу процесів
+        global command_job
+        
+        async def on_done(job):
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=f"🏁 Команду завершено з кодом {job.returncode} за {job.duration:.1f} с",
+                reply_markup=get_command_keyboard() if waiting_command else get_main_keyboard()
             )
-            
-            command_output = ""
-            
-            # Читаємо вивід асинхронно в фоні (не блокуємо!)
-            async def read_output():
-                global command_output, command_process
-                try:
-                    while command_process and command_process.returncode is None:
-                        try:
-                            line = await asyncio.wait_for(command_process.stdout.readline(), timeout=0.5)
-                            if not line:
-                                break
-                            command_output += line.decode('utf-8', errors='replace')
-                            # Обмежуємо розмір буфера
-                            if len(command_output) > 50000:
-                                command_output = command_output[-40000:]
-                        except asyncio.TimeoutError:
-                            continue
-                except:
-                    pass
-            
-            # Запускаємо читання в фоні - НЕ чекаємо!
-            asyncio.create_task(read_output())
-                
-        except Exception as e:
-            await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_command_keyboard())
-            command_process = None
+        
+        # Вивід читає черга завдань у фоні, процес - у власній групі процесів
+        command_job = jobs.submit(text, kind="shell", priority=10,
+                                  timeout=0, on_done=on_done)
+        position = jobs.position(command_job)
+        queued = f"\n\n⏳ У черзі, позиція {position}" if position else ""
+        await update.message.reply_text(f"⏳ Виконую: `{text}`{queued}\n\nНатисни 🔄 Оновити щоб побачити вивід\n⛔ Ctrl+C щоб зупинити", 
+                                       parse_mode='Markdown', reply_markup=get_command_keyboard())
         return
     
-    # Режим airgeddon
-    if active_process and active_process.returncode is None:
-        try:
-            active_process.stdin.write(f"{text}\n".encode())
-            await active_process.stdin.drain()
-            waiting_manual_input = False
-            await update.message.reply_text(f"✅ Відправлено: {text}\n⏳ Зачекай 3 сек...", reply_markup=get_airgeddon_keyboard())
-        except Exception as e:
-            await update.message.reply_text(f"❌ Помилка: {e}", reply_markup=get_airgeddon_keyboard())
-    else:
-        await update.message.reply_text("⭕ Немає активного процесу. Спочатку запусти програму.", reply_markup=get_main_keyboard())
+    # Режим airgeddon: "5 enter 2 enter" - послідовність клавіш, інакше один рядок
+    if await send_keys(update, parse_keys(text), trace):
+        waiting_manual_input = False
+
+
+async def post_init(application: Application):
+    """Запуск hub-сервера і сторожа event loop разом з ботом, правила /watch з історії"""
+    global hub
+    loop_watchdog.start(asyncio.get_running_loop())
+    watchset.set_rules([WatchRule(watch_id, scope, pattern, level, bool(sound))
+                        for watch_id, scope, pattern, level, sound in await asyncio.to_thread(history.watches)])
+    jobs.on_line = functools.partial(watch_job_line, application.bot)
+    if HUB_PORT:
+        hub = HubServer(HUB_HOST, HUB_PORT, HUB_SECRET)
+        await hub.start()
+
+
+async def post_shutdown(application: Application):
+    """Зупинка hub-сервера, нагляду за процесами і запис решти історії"""
+    if hub:
+        await hub.close()
+    await supervisor.close()
+    loop_watchdog.stop()
+    await asyncio.to_thread(history.close)
 
 
 def main():
     """Головна функція"""
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Різні чати і "вільні" дії - паралельно, ввід одного чату - по черзі
+    processor = ChatOrderedUpdateProcessor(
+        UPDATES_CONCURRENCY, is_free_update,
+        on_received=lambda update: tracer.update_received(update.update_id),
+    )
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(RoutingRequest(api_request, media_request))
+        .get_updates_request(updates_request)
+        .concurrent_updates(processor)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Команди
     application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("trace", trace_command))
+    application.add_handler(CommandHandler("lag", lag_command))
+    application.add_handler(CommandHandler("http", http_command))
+    application.add_handler(CommandHandler("mem", mem_command))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("run", run_shell_command))
+    application.add_handler(CommandHandler("bg", bg_command))
+    application.add_handler(CommandHandler("jobs", jobs_command))
+    application.add_handler(CommandHandler("kill", kill_command))
+    application.add_handler(CommandHandler("every", every_command))
+    application.add_handler(CommandHandler("unevery", unevery_command))
+    application.add_handler(CommandHandler("watch", watch_command))
+    application.add_handler(CommandHandler("unwatch", unwatch_command))
+    application.add_handler(CommandHandler("captures", captures_command))
     
     # Кнопки (порядок важливий - специфічні перед загальними)
     application.add_handler(MessageHandler(filters.Regex("^🚀 Start Program$"), button_start_program))
     application.add_handler(MessageHandler(filters.Regex("^📡 Airgeddon$"), button_airgeddon))
     application.add_handler(MessageHandler(filters.Regex("^📦 Хендшейки$"), button_handshakes))
+    application.add_handler(CallbackQueryHandler(capture_browser_callback, pattern="^hs:"))
+    application.add_handler(MessageHandler(filters.Regex("^🖧 Вузли$"), button_nodes))
+    application.add_handler(MessageHandler(filters.Regex("^🖧 "), button_select_node))
     application.add_handler(MessageHandler(filters.Regex("^🛑 Stop Program$"), button_stop_program))
     application.add_handler(MessageHandler(filters.Regex("^📊 Status$"), button_status))
     application.add_handler(MessageHandler(filters.Regex("^⏎ Enter$"), button_enter))
     application.add_handler(MessageHandler(filters.Regex("^🔄 Оновити$"), button_refresh))
+    application.add_handler(MessageHandler(filters.Regex("^📜 Хвіст$"), button_tail))
     application.add_handler(MessageHandler(filters.Regex("^✍️ Ввід$"), button_manual_input))
     application.add_handler(MessageHandler(filters.Regex("^⛔ Ctrl\\+C$"), button_ctrlc))
     application.add_handler(MessageHandler(filters.Regex("^🔙 Назад$"), button_back))
@@ -0,0 +1,188 @@
+"""
+Пошук файлів хендшейків на диску
+Спільний для бота і агентів вузлів (agent.py)
+
+CaptureIndex - знімок списку в пам'яті для перегляду в чаті: сторінки,
+сортування і фільтри рахуються без звернень до файлової системи.
+"""
+
+import glob
+import itertools
+import os
+import stat
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+# Шукаємо файли хендшейків тільки в /root/
+HANDSHAKE_PATTERNS = [
+    "/root/*.cap",
+    "/root/*.pcap",
+    "/root/*.pcapng",
+    "/root/*.hccapx",
+    "/root/*.22000",
+]
+
+ESSID_READ_LIMIT = 64 * 1024  # Байт з початку .22000 для пошуку ESSID
+HCCAPX_SIGNATURE = b"HCPX"
+
+
+class CaptureInfo(NamedTuple):
+    """Опис одного файлу захоплення"""
+    path: str
+    size: int
+    mtime: float
+    essid: str = ""  # Мережі з файлу (де їх можна дешево прочитати)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+def format_size(size: int) -> str:
+    """Розмір файлу у вигляді '123 B' / '45 KB'"""
+    return f"{size} B" if size < 1024 else f"{size//1024} KB"
+
+
+def format_mtime(mtime: float) -> str:
+    """Дата зміни файлу у форматі чату"""
+    return datetime.fromtimestamp(mtime).strftime("%d.%m.%Y %H:%M")
+
+
+def read_essid(path: str) -> str:
+    """ESSID з заголовка .hccapx або записів .22000 (для .cap/.pcap - порожньо)"""
+    try:
+        if path.endswith(".hccapx"):
+            with open(path, 'rb') as f:
+                header = f.read(42)
+            if header[:4] != HCCAPX_SIGNATURE or len(header) < 42:
+                return ""
+            return header[10:10 + min(header[9], 32)].decode(errors="replace")
+        if path.endswith(".22000"):
+            with open(path, 'rb') as f:
+                data = f.read(ESSID_READ_LIMIT)
+            essids = []
+            # WPA*тип*PMKID/MIC*MAC AP*MAC STA*ESSID(hex)*...
+            for line in data.splitlines():
+                fields = line.split(b"*")
+                if len(fields) > 5:
+                    try:
+                        essid = bytes.fromhex(fields[5].decode()).decode(errors="replace")
+                    except ValueError:
+                        continue
+                    if essid and essid not in essids:
+                        essids.append(essid)
+            return ", ".join(essids)
+    except OSError:
+        pass
+    return ""
+
+
+def find_handshake_files(patterns=HANDSHAKE_PATTERNS) -> list:
+    """Повертає список CaptureInfo, найновіші першими.
+
+    Виконує синхронні виклики файлової системи - з event loop
+    викликати через asyncio.to_thread().
+    """
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(pattern))
+
+    files = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        # Пропускаємо директорії
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        files.append(CaptureInfo(path, st.st_size, st.st_mtime, read_essid(path)))
+
+    files.sort(key=lambda f: f.mtime, reverse=True)  # Сортуємо по даті
+    return files
+
+
+# Ключ сортування і чи сортувати за спаданням
+SORT_KEYS = {
+    "date": (lambda f: f.mtime, True),
+    "size": (lambda f: f.size, True),
+    "name": (lambda f: f.name.lower(), False),
+}
+
+_index_ids = itertools.count(1)
+
+
+class CaptureIndex:
+    """Список захоплень у пам'яті з сортуванням, фільтрами і сторінками
+
+    Порядки сортування будуються один раз на ключ, відфільтрований вигляд -
+    один раз на комбінацію фільтрів; перегортання сторінок - лише зріз.
+    """
+
+    def __init__(self, files: list, page_size: int = 8):
+        self.id = next(_index_ids)  # Щоб відрізняти застарілі кнопки
+        self.files = list(files)
+        self.page_size = page_size
+        self.sort = "date"
+        self.ext: Optional[str] = None
+        self.query = ""
+        self.page = 0
+        self._orders: dict = {}
+        self._view_key = None
+        self._view: list = []
+        # Рядок для пошуку: ім'я файлу + ESSID, у нижньому регістрі
+        self._haystack = [f"{f.name}\n{f.essid}".lower() for f in self.files]
+
+    def extensions(self) -> list:
+        return sorted({os.path.splitext(f.path)[1] for f in self.files})
+
+    def _order(self, sort: str) -> list:
+        order = self._orders.get(sort)
+        if order is None:
+            key, reverse = SORT_KEYS[sort]
+            order = sorted(range(len(self.files)), key=lambda i: key(self.files[i]), reverse=reverse)
+            self._orders[sort] = order
+        return order
+
+    def view(self) -> list:
+        """Індекси файлів з урахуванням сортування і фільтрів"""
+        view_key = (self.sort, self.ext, self.query)
+        if view_key != self._view_key:
+            query = self.query.lower()
+            self._view = [
+                i for i in self._order(self.sort)
+                if (self.ext is None or self.files[i].path.endswith(self.ext))
+                and (not query or query in self._haystack[i])
+            ]
+            self._view_key = view_key
+        return self._view
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-len(self.view()) // self.page_size))
+
+    def set_page(self, page: int):
+        self.page = max(0, min(page, self.pages - 1))
+
+    def set_filter(self, sort: Optional[str] = None, ext: Optional[str] = "", query: Optional[str] = None):
+        """Змінює сортування/фільтри і повертає на першу сторінку
+
+        ext="" - не змінювати, ext=None - всі розширення.
+        """
+        if sort is not None:
+            if sort not in SORT_KEYS:
+                raise ValueError(f"невідоме сортування: {sort}")
+            self.sort = sort
+        if ext != "":
+            self.ext = ext
+        if query is not None:
+            self.query = query.strip()
+        self.page = 0
+
+    def page_items(self) -> list:
+        """[(індекс, CaptureInfo)] поточної сторінки"""
+        start = self.page * self.page_size
+        return [(i, self.files[i]) for i in self.view()[start:start + self.page_size]]
+
+    def get(self, index: int) -> Optional[CaptureInfo]:
+        return self.files[index] if 0 <= index < len(self.files) else None
@@ -0,0 +1,207 @@
+"""
+Історія команд і сесій у вбудованій SQLite
+
+Запис іде через фоновий потік-писар пакетами, тож event loop ніколи
+не чекає на диск. Читання (/history, /stats) - з окремого з'єднання
+через asyncio.to_thread().
+"""
+
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200        # Максимум записів в одній транзакції
+FLUSH_INTERVAL = 1.0    # сек - як довго писар накопичує пакет
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id        INTEGER PRIMARY KEY,
+    kind      TEXT    NOT NULL,
+    node      TEXT    NOT NULL,
+    command   TEXT    NOT NULL,
+    started   REAL    NOT NULL,
+    finished  REAL,
+    duration  REAL,
+    exit_code INTEGER,
+    bytes_out INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started);
+CREATE INDEX IF NOT EXISTS runs_kind_started ON runs(kind, started);
+CREATE INDEX IF NOT EXISTS runs_command ON runs(command);
+
+CREATE TABLE IF NOT EXISTS captures (
+    id      INTEGER PRIMARY KEY,
+    run_id  INTEGER REFERENCES runs(id),
+    node    TEXT    NOT NULL,
+    path    TEXT    NOT NULL,
+    size    INTEGER NOT NULL,
+    created REAL    NOT NULL,
+    UNIQUE (node, path)
+);
+CREATE INDEX IF NOT EXISTS captures_created ON captures(created);
+
+CREATE TABLE IF NOT EXISTS watches (
+    id      INTEGER PRIMARY KEY,
+    scope   TEXT    NOT NULL,
+    pattern TEXT    NOT NULL,
+    level   TEXT    NOT NULL,
+    sound   INTEGER NOT NULL,
+    created REAL    NOT NULL
+);
+"""
+
+_INSERT_RUN = "INSERT INTO runs (id, kind, node, command, started) VALUES (?, ?, ?, ?, ?)"
+_FINISH_RUN = ("UPDATE runs SET finished = ?, duration = ?, exit_code = ?, bytes_out = ? "
+               "WHERE id = ?")
+_INSERT_CAPTURE = ("INSERT OR IGNORE INTO captures (run_id, node, path, size, created) "
+                   "VALUES (?, ?, ?, ?, ?)")
+_INSERT_WATCH = ("INSERT INTO watches (id, scope, pattern, level, sound, created) "
+                 "VALUES (?, ?, ?, ?, ?, ?)")
+_DELETE_WATCH = "DELETE FROM watches WHERE id = ?"
+
+
+class Run:
+    """Запуск команди або сесії, що зараз виконується"""
+
+    __slots__ = ("id", "kind", "node", "command", "started", "finished", "bytes_out")
+
+    def __init__(self, run_id: int, kind: str, node: str, command: str):
+        self.id = run_id
+        self.kind = kind
+        self.node = node
+        self.command = command
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.bytes_out = 0
+
+
+class History:
+    """SQLite-історія з пакетним фоновим записом"""
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        conn.execute("PRAGMA journal_mode=WAL")
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM runs").fetchone()[0]
+        last_watch = conn.execute("SELECT COALESCE(MAX(id), 0) FROM watches").fetchone()[0]
+        conn.close()
+
+        # id призначаємо самі, щоб не чекати lastrowid від писаря
+        self._ids = itertools.count(last_id + 1)
+        self._watch_ids = itertools.count(last_watch + 1)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+        self._thread.start()
+
+    # --- Запис (не блокує) ---
+
+    def start_run(self, kind: str, node: str, command: str) -> Run:
+        run = Run(next(self._ids), kind, node, command)
+        self._queue.put((_INSERT_RUN, (run.id, kind, node, command, run.started)))
+        return run
+
+    def finish_run(self, run: Run, exit_code: Optional[int]):
+        run.finished = time.time()
+        self._queue.put((_FINISH_RUN, (run.finished, run.finished - run.started, exit_code,
+                                       run.bytes_out, run.id)))
+
+    def add_capture(self, run: Optional[Run], node: str, path: str, size: int, created: float):
+        self._queue.put((_INSERT_CAPTURE, (run.id if run else None, node, path, size, created)))
+
+    def add_watch(self, scope: str, pattern: str, level: str, sound: bool) -> int:
+        watch_id = next(self._watch_ids)
+        self._queue.put((_INSERT_WATCH, (watch_id, scope, pattern, level, int(sound), time.time())))
+        return watch_id
+
+    def remove_watch(self, watch_id: int):
+        self._queue.put((_DELETE_WATCH, (watch_id,)))
+
+    @property
+    def pending(self) -> int:
+        """Записів, що чекають на запис у базу"""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Блокує до запису всього, що в черзі (викликати через to_thread)"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _writer(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while item is not None and len(batch) < BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            entries = [entry for entry in batch if entry is not None]
+            stop = len(entries) != len(batch)
+            try:
+                with conn:
+                    for entry in entries:
+                        conn.execute(*entry)
+            except sqlite3.Error as e:
+                # Пакет - одна транзакція, і одна помилка відкотила всі записи:
+                # повторюємо по одному, щоб втратити тільки поганий
+                logger.warning(f"Помилка пакета історії ({e}), записую по одному")
+                for entry in entries:
+                    try:
+                        with conn:
+                            conn.execute(*entry)
+                    except sqlite3.Error as e:
+                        logger.error(f"Помилка запису історії: {e}: {entry[0]} {entry[1]!r}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    # --- Читання (синхронне, викликати через to_thread) ---
+
+    def _read(self, sql: str, params=()) -> list:
+        self.flush()
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def recent_runs(self, limit: int = 10) -> list:
+        return self._read(
+            "SELECT started, kind, node, command, duration, exit_code, bytes_out "
+            "FROM runs ORDER BY started DESC LIMIT ?", (limit,))
+
+    def stats(self, since: float = 0) -> dict:
+        by_kind = self._read(
+            "SELECT kind, COUNT(*), SUM(exit_code = 0), AVG(duration), "
+            "COALESCE(SUM(bytes_out), 0) FROM runs WHERE started >= ? GROUP BY kind", (since,))
+        top = self._read(
+            "SELECT command, COUNT(*) AS n FROM runs WHERE started >= ? "
+            "GROUP BY command ORDER BY n DESC LIMIT 5", (since,))
+        captures = self._read(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM captures WHERE created >= ?",
+            (since,))[0]
+        return {"by_kind": by_kind, "top": top, "captures": captures}
+
+    def watches(self) -> list:
+        """[(id, scope, pattern, level, sound)] правил спостереження"""
+        return self._read("SELECT id, scope, pattern, level, sound FROM watches ORDER BY id")
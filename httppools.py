@@ -0,0 +1,105 @@
+"""
+Окремі пули HTTP-з'єднань до Bot API
+
+- updates - довгий getUpdates, не займає з'єднання інших пулів
+- api     - легкі виклики: повідомлення, редагування, відповіді на кнопки
+- media   - відправка файлів; повільне завантаження по LTE не блокує api
+
+Кожен пул має власний ліміт з'єднань, таймаути і keep-alive. Статистика
+пулів - для /http.
+"""
+
+import time
+from typing import Optional
+
+import httpx
+from telegram.error import NetworkError, TimedOut
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+
+class PoolStats:
+    """Лічильники одного пулу"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.peak = 0            # Найбільше одночасних запитів
+        self.busy_time = 0.0     # Сумарна тривалість запитів, сек
+        self.slowest = 0.0
+        self.last_method = ""
+
+
+class TrackedRequest(HTTPXRequest):
+    """HTTPXRequest зі статистикою і налаштовуваним keep-alive"""
+
+    def __init__(self, name: str, pool_size: int, read_timeout: float, write_timeout: float,
+                 connect_timeout: float, pool_timeout: float, keepalive: float):
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                              keepalive_expiry=keepalive)
+        super().__init__(
+            connection_pool_size=pool_size,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            connect_timeout=connect_timeout,
+            pool_timeout=pool_timeout,
+            media_write_timeout=write_timeout,
+            httpx_kwargs={"limits": limits},
+        )
+        self.name = name
+        self.pool_size = pool_size
+        self.stats = PoolStats()
+
+    def connections(self) -> Optional[int]:
+        """Відкриті з'єднання пулу (внутрішні дані httpx, тож без гарантій)"""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         *args, **kwargs):
+        stats = self.stats
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak = max(stats.peak, stats.in_flight)
+        stats.last_method = url.rsplit("/", 1)[-1]
+        started = time.monotonic()
+        try:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        except TimedOut:
+            stats.timeouts += 1
+            raise
+        except NetworkError:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            stats.in_flight -= 1
+            stats.busy_time += elapsed
+            stats.slowest = max(stats.slowest, elapsed)
+
+
+class RoutingRequest(BaseRequest):
+    """Запити з файлами - в пул media, решта - в пул api"""
+
+    def __init__(self, api: TrackedRequest, media: TrackedRequest):
+        self.api = api
+        self.media = media
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.api.read_timeout
+
+    async def initialize(self):
+        await self.api.initialize()
+        await self.media.initialize()
+
+    async def shutdown(self):
+        await self.api.shutdown()
+        await self.media.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         *args, **kwargs):
+        target = self.media if request_data is not None and request_data.contains_files else self.api
+        return await target.do_request(url, method, request_data, *args, **kwargs)
@@ -0,0 +1,464 @@
+"""
+Hub-режим: один бот керує багатьма вузлами через легкі агенти (agent.py)
+
+Протокол - одне TCP-з'єднання на вузол, мультиплексоване по каналах:
+  кадр = 4 байти довжини (big-endian) + 1 байт прапорців + payload
+  payload = JSON-заголовок + b"\\0" + бінарне тіло (zlib, якщо вигідно)
+
+Автентифікація взаємна, секрет по мережі не передається:
+  бот   -> challenge(nonce бота)
+  агент -> hello(ім'я, nonce агента, HMAC(секрет, "agent", ім'я, nonce бота, nonce агента))
+  бот   -> welcome(HMAC(секрет, "hub", ім'я, nonce агента, nonce бота))
+Агент виконує команди тільки після того, як перевірив доказ бота.
+
+Потік даних агент -> бот (вивід процесів, файли) обмежений кредитним вікном
+на вузол: агент витрачає кредит на кожен кадр з даними, бот повертає кредит
+після того, як дані реально спожиті (відправлені в чат / записані на диск).
+"""
+
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import secrets
+import signal
+import struct
+import zlib
+from collections import deque
+from typing import Optional
+
+from captures import CaptureInfo
+from supervisor import StopReport
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 2
+LOCAL_NODE = "local"
+
+FLAG_ZLIB = 0x01
+COMPRESS_THRESHOLD = 512          # Менші кадри не стискаємо
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+HEARTBEAT_INTERVAL = 10           # сек між ping
+HEARTBEAT_TIMEOUT = 35            # сек тиші до розриву з'єднання
+INITIAL_WINDOW = 256 * 1024       # Кредит агента на вузол, байт
+CHUNK_SIZE = 64 * 1024            # Розмір шматка при передачі файлів
+PARTIAL_LIMIT = 8 * 1024          # Незавершений рядок довший за це віддається як є
+NONCE_SIZE = 16                   # Байт випадковості в challenge
+
+_HEADER = struct.Struct(">IB")
+
+
+class ProtocolError(Exception):
+    """Некоректний кадр або розрив протоколу"""
+
+
+class RemoteError(Exception):
+    """Помилка, яку повернув агент"""
+
+
+def new_nonce() -> str:
+    return secrets.token_hex(NONCE_SIZE)
+
+
+def auth_proof(secret: str, role: str, name: str, *nonces: str) -> str:
+    """HMAC-SHA256 доказ знання секрету; роль не дає повторити доказ іншої сторони"""
+    message = "\0".join((role, name) + nonces).encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def encode_frame(msg: dict, body: bytes = b"") -> bytes:
+    """Кодує повідомлення в кадр"""
+    payload = json.dumps(msg, separators=(",", ":")).encode() + b"\0" + body
+    flags = 0
+    if len(payload) > COMPRESS_THRESHOLD:
+        packed = zlib.compress(payload, 1)
+        if len(packed) < len(payload):
+            payload = packed
+            flags |= FLAG_ZLIB
+    return _HEADER.pack(len(payload) + 1, flags) + payload
+
+
+def decode_payload(flags: int, payload: bytes):
+    """Розбирає payload кадру на (msg, body)"""
+    try:
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        head, sep, body = payload.partition(b"\0")
+        if not sep:
+            raise ProtocolError("кадр без заголовка")
+        return json.loads(head), body
+    except (zlib.error, ValueError) as e:
+        raise ProtocolError(f"пошкоджений кадр: {e}") from e
+
+
+class FrameConnection:
+    """Кадрове з'єднання з чергою відправки і heartbeat (спільне для бота і агента)"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.last_seen = asyncio.get_running_loop().time()
+        self.closed = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def send(self, msg: dict, body: bytes = b""):
+        """Ставить кадр у чергу відправки (не блокує)"""
+        if not self.closed:
+            self.outgoing.put_nowait(encode_frame(msg, body))
+
+    async def drain(self):
+        """Чекає поки всі кадри з черги записані в сокет"""
+        await self.outgoing.join()
+
+    async def recv(self):
+        header = await self.reader.readexactly(_HEADER.size)
+        length, flags = _HEADER.unpack(header)
+        if length < 1 or length > MAX_FRAME_SIZE:
+            raise ProtocolError(f"неприпустима довжина кадру: {length}")
+        payload = await self.reader.readexactly(length - 1)
+        self.bytes_in += length + 4
+        self.last_seen = asyncio.get_running_loop().time()
+        return decode_payload(flags, payload)
+
+    async def _write_loop(self):
+        while True:
+            frame = await self.outgoing.get()
+            try:
+                self.writer.write(frame)
+                await self.writer.drain()
+                self.bytes_out += len(frame)
+            finally:
+                self.outgoing.task_done()
+
+    async def _heartbeat_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if loop.time() - self.last_seen > HEARTBEAT_TIMEOUT:
+                logger.warning("Heartbeat timeout, закриваю з'єднання")
+                self.writer.close()
+                return
+            self.send({"t": "ping"})
+
+    async def run(self, handler):
+        """Читає кадри і передає їх у handler(msg, body) до розриву з'єднання"""
+        writer_task = asyncio.create_task(self._write_loop())
+        heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        try:
+            while True:
+                msg, body = await self.recv()
+                kind = msg.get("t")
+                if kind == "ping":
+                    self.send({"t": "pong"})
+                elif kind == "pong":
+                    pass
+                else:
+                    await handler(msg, body)
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError) as e:
+            logger.debug(f"З'єднання закрито: {e!r}")
+        finally:
+            self.closed = True
+            writer_task.cancel()
+            heartbeat_task.cancel()
+            # Розблоковуємо всіх, хто чекає drain()
+            while not self.outgoing.empty():
+                self.outgoing.get_nowait()
+                self.outgoing.task_done()
+            self.writer.close()
+
+
+class CreditGate:
+    """Кредитне вікно відправника: блокує відправку даних поки немає кредиту"""
+
+    def __init__(self, window: int = INITIAL_WINDOW):
+        self.available = window
+        self._event = asyncio.Event()
+        self._event.set()
+
+    async def acquire(self, n: int):
+        while self.available <= 0:
+            self._event.clear()
+            await self._event.wait()
+        self.available -= n
+
+    def grant(self, n: int):
+        self.available += n
+        if self.available > 0:
+            self._event.set()
+
+
+class RemoteStream:
+    """Потік виводу віддаленого процесу з інтерфейсом StreamReader.readline()"""
+
+    def __init__(self, node: "Node"):
+        self._node = node
+        self._lines: deque = deque()
+        self._partial = b""
+        self._eof = False
+        self._event = asyncio.Event()
+
+    def feed(self, data: bytes):
+        data = self._partial + data
+        *lines, self._partial = data.split(b"\n")
+        lines = [line + b"\n" for line in lines]
+        # Вивід без \n (перемальовування екрана, \r-прогрес) інакше накопичувався б
+        # у _partial, кредит за нього не повертався б, і вікно вузла вичерпалось би
+        if len(self._partial) > PARTIAL_LIMIT:
+            lines.append(self._partial)
+            self._partial = b""
+        self._lines.extend(lines)
+        if lines:
+            self._event.set()
+
+    def feed_eof(self):
+        if self._partial:
+            self._lines.append(self._partial)
+            self._partial = b""
+        self._eof = True
+        self._event.set()
+
+    async def readline(self) -> bytes:
+        while not self._lines:
+            if self._eof:
+                return b""
+            self._event.clear()
+            await self._event.wait()
+        line = self._lines.popleft()
+        # Дані спожиті - повертаємо кредит агенту
+        self._node.consumed(len(line))
+        return line
+
+
+class RemoteStdin:
+    """stdin віддаленого процесу з інтерфейсом StreamWriter.write()/drain()"""
+
+    def __init__(self, node: "Node", ch: int):
+        self._node = node
+        self._ch = ch
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self._buffer += data
+
+    async def drain(self):
+        if self._buffer:
+            self._node.conn.send({"t": "stdin", "ch": self._ch}, bytes(self._buffer))
+            self._buffer.clear()
+        await self._node.conn.drain()
+
+
+class RemoteProcess:
+    """Процес на вузлі з інтерфейсом asyncio.subprocess.Process"""
+
+    def __init__(self, node: "Node", ch: int, pid: int):
+        self.node = node
+        self.ch = ch
+        self.pid = pid
+        self.returncode: Optional[int] = None
+        self.stdin = RemoteStdin(node, ch)
+        self.stdout = RemoteStream(node)
+        self.stderr = RemoteStream(node)
+        self._exited = asyncio.Event()
+
+    def _set_exit(self, code: int):
+        self.stdout.feed_eof()
+        self.stderr.feed_eof()
+        self.returncode = code
+        self._exited.set()
+
+    async def wait(self) -> int:
+        await self._exited.wait()
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        self.node.conn.send({"t": "signal", "ch": self.ch, "sig": int(sig)})
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    async def stop(self) -> StopReport:
+        """Зупинка всього дерева процесу на вузлі (ескалація сигналів на агенті)"""
+        return await self.node.stop(self)
+
+
+class Node:
+    """Підключений агент на стороні бота"""
+
+    def __init__(self, name: str, conn: FrameConnection):
+        self.name = name
+        self.conn = conn
+        self.processes: dict = {}
+        self._pending: dict = {}
+        self._sinks: dict = {}
+        self._channels = itertools.count(1)
+        self._unacked = 0
+
+    def consumed(self, n: int):
+        """Повертає агенту кредит, коли спожито чверть вікна"""
+        self._unacked += n
+        if self._unacked >= INITIAL_WINDOW // 4:
+            self.conn.send({"t": "credit", "n": self._unacked})
+            self._unacked = 0
+
+    async def _request(self, msg: dict, sink=None):
+        if self.conn.closed:
+            # send() на закритому з'єднанні мовчки відкидає кадр - відповіді не буде
+            raise RemoteError("вузол відключився")
+        ch = next(self._channels)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[ch] = future
+        if sink is not None:
+            self._sinks[ch] = sink
+        self.conn.send(dict(msg, ch=ch))
+        try:
+            return ch, await future
+        finally:
+            self._pending.pop(ch, None)
+            self._sinks.pop(ch, None)
+
+    async def spawn(self, command: list) -> RemoteProcess:
+        """Запускає процес на вузлі"""
+        _, proc = await self._request({"t": "spawn", "cmd": list(command)})
+        return proc
+
+    async def stop(self, proc: RemoteProcess) -> StopReport:
+        _, reply = await self._request({"t": "stop", "target": proc.ch})
+        return StopReport(reply["signal"], [tuple(p) for p in reply["leaked"]])
+
+    async def list_captures(self) -> list:
+        """Список хендшейків на вузлі"""
+        _, reply = await self._request({"t": "list"})
+        return [CaptureInfo(*f) for f in reply["files"]]
+
+    async def fetch(self, path: str, fileobj):
+        """Потоково завантажує файл з вузла у fileobj"""
+        await self._request({"t": "fetch", "path": path}, sink=fileobj)
+
+    async def merge(self, paths: list, fileobj, handshake_only: bool = False) -> dict:
+        """Об'єднує файли захоплення на вузлі і потоково завантажує результат у fileobj"""
+        _, reply = await self._request(
+            {"t": "merge", "paths": list(paths), "handshake_only": handshake_only}, sink=fileobj)
+        return reply["stats"]
+
+    def _resolve(self, ch, result=None, error=None):
+        future = self._pending.get(ch)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(RemoteError(error))
+        else:
+            future.set_result(result)
+
+    async def handle(self, msg: dict, body: bytes):
+        kind = msg.get("t")
+        ch = msg.get("ch")
+        if kind == "out":
+            proc = self.processes.get(ch)
+            if proc is None:
+                self.consumed(len(body))
+                return
+            stream = proc.stderr if msg.get("fd") == 2 else proc.stdout
+            stream.feed(body)
+        elif kind == "chunk":
+            sink = self._sinks.get(ch)
+            if sink is not None:
+                await asyncio.to_thread(sink.write, body)
+            self.consumed(len(body))
+        elif kind == "exit":
+            proc = self.processes.pop(ch, None)
+            if proc is not None:
+                proc._set_exit(msg.get("code", -1))
+        elif kind == "result":
+            if "pid" in msg:
+                # Реєструємо процес одразу, щоб не загубити вивід,
+                # що прийде раніше ніж spawn() отримає результат
+                proc = RemoteProcess(self, ch, msg["pid"])
+                self.processes[ch] = proc
+                self._resolve(ch, result=proc)
+            else:
+                self._resolve(ch, result=msg)
+        elif kind == "error":
+            self._resolve(ch, error=msg.get("error", "невідома помилка"))
+        else:
+            logger.warning(f"[{self.name}] Невідомий кадр: {kind}")
+
+    def disconnected(self):
+        self.conn.closed = True
+        for proc in self.processes.values():
+            proc._set_exit(-1)
+        self.processes.clear()
+        for ch in list(self._pending):
+            self._resolve(ch, error="вузол відключився")
+
+
+class HubServer:
+    """TCP-сервер, до якого підключаються агенти вузлів"""
+
+    def __init__(self, host: str, port: int, secret: str):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.nodes: dict = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        logger.info(f"Hub слухає на {self.host}:{self.port}")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for node in list(self.nodes.values()):
+            node.conn.writer.close()
+
+    def get(self, name: str) -> Optional[Node]:
+        return self.nodes.get(name)
+
+    async def _handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        conn = FrameConnection(reader, writer)
+        nonce = new_nonce()
+        try:
+            writer.write(encode_frame({"t": "challenge", "v": PROTOCOL_VERSION, "nonce": nonce}))
+            await writer.drain()
+            hello, _ = await asyncio.wait_for(conn.recv(), timeout=HEARTBEAT_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Hub: невдале підключення {peer}: {e}")
+            writer.close()
+            return
+
+        name = str(hello.get("name", ""))
+        agent_nonce = str(hello.get("nonce", ""))
+        expected = auth_proof(self.secret, "agent", name, nonce, agent_nonce)
+        if (hello.get("t") != "hello"
+                or hello.get("v") != PROTOCOL_VERSION
+                or len(agent_nonce) != NONCE_SIZE * 2
+                or not hmac.compare_digest(str(hello.get("proof", "")), expected)):
+            logger.warning(f"Hub: відхилено підключення {peer}")
+            writer.close()
+            return
+        if not name or name == LOCAL_NODE or name in self.nodes:
+            writer.write(encode_frame({"t": "error", "error": f"ім'я вузла зайняте: {name}"}))
+            writer.close()
+            return
+
+        node = Node(name, conn)
+        self.nodes[name] = node
+        conn.send({"t": "welcome", "window": INITIAL_WINDOW,
+                   "proof": auth_proof(self.secret, "hub", name, agent_nonce, nonce)})
+        logger.info(f"Hub: вузол '{name}' підключено ({peer})")
+        try:
+            await conn.run(node.handle)
+        finally:
+            node.disconnected()
+            if self.nodes.get(name) is node:
+                del self.nodes[name]
+            logger.info(f"Hub: вузол '{name}' відключено")
@@ -0,0 +1,465 @@
+"""
+Черга фонових завдань з лімітами паралельності, пріоритетами і таймаутами
+
+Кожне завдання - shell-команда у власній групі процесів з пониженим
+пріоритетом (nice) і необов'язковим лімітом пам'яті, щоб важкі сканування
+не відбирали CPU у захоплення.
+
+Повторювані команди (Scheduler) теж ідуть через чергу: після кожного
+запуску порівнюють вивід з попереднім і повідомляють тільки про зміни.
+"""
+
+import asyncio
+import difflib
+import heapq
+import itertools
+import logging
+import os
+import resource
+import signal
+import time
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+KILL_GRACE = 3.0         # сек між SIGTERM і SIGKILL
+OUTPUT_LIMIT = 50000     # Символів виводу, що зберігаються для завдання
+
+# Категорії за іменем програми (можна перевизначити через -c)
+CATEGORY_COMMANDS = {
+    "scan": {"nmap", "masscan", "nikto", "arp-scan", "netdiscover"},
+    "crack": {"aircrack-ng", "hashcat", "john", "cowpatty"},
+}
+DEFAULT_CATEGORY = "default"
+
+
+def detect_category(command: str) -> str:
+    """Категорія команди за першим словом"""
+    parts = command.split()
+    if parts and parts[0] == "sudo":
+        parts = parts[1:]
+    program = os.path.basename(parts[0]) if parts else ""
+    for category, programs in CATEGORY_COMMANDS.items():
+        if program in programs:
+            return category
+    return DEFAULT_CATEGORY
+
+
+def parse_limits(spec: str) -> dict:
+    """'scan=1,crack=1' -> {'scan': 1, 'crack': 1}"""
+    limits = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class OutputBuffer:
+    """Рядки виводу з наскрізною нумерацією і курсорами глядачів
+
+    Старі рядки витісняються при перевищенні ліміту символів, але номери
+    рядків не зсуваються - тож курсор глядача лишається коректним і можна
+    порахувати, скільки рядків він пропустив.
+    """
+
+    def __init__(self, limit: int = OUTPUT_LIMIT):
+        self.limit = limit
+        self.lines: deque = deque()
+        self.first = 0          # Номер найстарішого рядка в буфері
+        self.size = 0           # Символів у буфері
+        self.cursors: dict = {}  # глядач -> номер першого непрочитаного рядка
+
+    @property
+    def total(self) -> int:
+        """Скільки рядків отримано за весь час"""
+        return self.first + len(self.lines)
+
+    def append(self, line: str):
+        self.lines.append(line)
+        self.size += len(line)
+        # Обмежуємо розмір буфера
+        while self.size > self.limit and len(self.lines) > 1:
+            self.size -= len(self.lines.popleft())
+            self.first += 1
+
+    def text(self) -> str:
+        return "".join(self.lines)
+
+    def tail(self, count: int) -> list:
+        return list(itertools.islice(self.lines, max(0, len(self.lines) - count), None))
+
+    def read_new(self, viewer) -> tuple:
+        """Рядки після курсора глядача і кількість витіснених; зсуває курсор"""
+        cursor = self.cursors.get(viewer, 0)
+        missed = max(0, self.first - cursor)
+        start = max(cursor, self.first) - self.first
+        self.cursors[viewer] = self.total
+        return list(itertools.islice(self.lines, start, None)), missed
+
+
+class Job:
+    """Одне завдання черги"""
+
+    def __init__(self, job_id: int, command: str, *, kind: str, category: str, priority: int,
+                 timeout: Optional[float], mem_limit: Optional[int], on_output: Optional[Callable],
+                 on_done: Optional[Callable]):
+        self.id = job_id
+        self.command = command
+        self.kind = kind
+        self.category = category
+        self.priority = priority
+        self.timeout = timeout
+        self.mem_limit = mem_limit      # МБ
+        self.on_output = on_output
+        self.on_done = on_done
+        self.state = "queued"           # queued/running/done/failed/killed/timeout
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.returncode: Optional[int] = None
+        self.output_buffer = OutputBuffer()
+        self.bytes_out = 0
+        self.leaked: list = []          # Процеси, що пережили зупинку
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    @property
+    def output(self) -> str:
+        return self.output_buffer.text()
+
+    @property
+    def duration(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobQueue:
+    """Планувальник завдань з глобальним і покатегорійним лімітами"""
+
+    def __init__(self, max_running: int = 2, category_limits: Optional[dict] = None,
+                 default_timeout: Optional[float] = None, nice: int = 10, history=None,
+                 supervisor=None, on_line: Optional[Callable] = None):
+        self.max_running = max_running
+        self.category_limits = category_limits or {}
+        self.default_timeout = default_timeout
+        self.nice = nice
+        self.history = history
+        self.supervisor = supervisor
+        self.on_line = on_line          # Спільний обробник рядків усіх завдань (job, text)
+        self.jobs: dict = {}
+        self._queue: list = []
+        self._running: dict = {}
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._tasks: set = set()
+
+    def submit(self, command: str, *, kind: str = "job", category: Optional[str] = None,
+               priority: int = 0, timeout: Optional[float] = None, mem_limit: Optional[int] = None,
+               on_output: Optional[Callable] = None, on_done: Optional[Callable] = None) -> Job:
+        """Ставить команду в чергу. timeout=None - таймаут за замовчуванням, 0 - без таймауту"""
+        if timeout is None:
+            timeout = self.default_timeout
+        job = Job(next(self._ids), command, kind=kind,
+                  category=category or detect_category(command), priority=priority,
+                  timeout=timeout or None, mem_limit=mem_limit,
+                  on_output=on_output, on_done=on_done)
+        self.jobs[job.id] = job
+        heapq.heappush(self._queue, (-priority, next(self._seq), job))
+        self._schedule()
+        return job
+
+    def position(self, job: Job) -> int:
+        """Позиція завдання в черзі (1 - наступне), 0 - якщо вже не в черзі"""
+        queued = self.active()[len(self._running):]
+        return queued.index(job) + 1 if job in queued else 0
+
+    def running_in(self, category: str) -> int:
+        return sum(1 for job in self._running.values() if job.category == category)
+
+    def _can_start(self, job: Job) -> bool:
+        limit = self.category_limits.get(job.category)
+        return limit is None or self.running_in(job.category) < limit
+
+    def _schedule(self):
+        """Запускає завдання з найвищим пріоритетом, для яких є вільні слоти"""
+        skipped = []
+        while self._queue and len(self._running) < self.max_running:
+            entry = heapq.heappop(self._queue)
+            job = entry[2]
+            if job.state != "queued":
+                continue
+            if not self._can_start(job):
+                skipped.append(entry)
+                continue
+            self._running[job.id] = job
+            job.state = "running"
+            task = asyncio.create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def _preexec(self, job: Job):
+        nice = self.nice
+        mem_limit = job.mem_limit
+
+        def preexec():
+            if nice:
+                os.nice(nice)
+            if mem_limit:
+                limit = mem_limit * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        return preexec
+
+    async def _run(self, job: Job):
+        run = None
+        try:
+            spawn = self.supervisor.create_subprocess_shell if self.supervisor \
+                else asyncio.create_subprocess_shell
+            job.process = await spawn(
+                job.command,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True,  # Окрема група процесів для зупинки
+                preexec_fn=self._preexec(job),
+            )
+            job.started = time.time()
+            if self.history:
+                run = self.history.start_run(job.kind, "local", job.command)
+            if job.state == "killed":
+                # kill() прийшов під час запуску, коли зупиняти ще не було що
+                await self._terminate(job)
+
+            reader = asyncio.create_task(self._read_output(job))
+            try:
+                await asyncio.wait_for(asyncio.shield(job.process.wait()), timeout=job.timeout)
+            except asyncio.TimeoutError:
+                job.state = "timeout"
+                await self._terminate(job)
+            await reader
+            job.returncode = job.process.returncode
+            if job.state == "running":
+                job.state = "done" if job.returncode == 0 else "failed"
+        except Exception as e:
+            logger.error(f"Помилка завдання #{job.id}: {e}")
+            job.output_buffer.append(f"❌ {e}\n")
+            job.state = "failed"
+            # Процес без читача заблокується на повному pipe і триматиме слот
+            await self._terminate(job)
+            if job.process:
+                job.returncode = job.process.returncode
+        finally:
+            job.finished = time.time()
+            if job.started is None:
+                job.started = job.finished
+            if run:
+                run.bytes_out = job.bytes_out
+                self.history.finish_run(run, job.returncode)
+            self._running.pop(job.id, None)
+            self.prune()
+            self._schedule()
+            if not job.done.done():
+                job.done.set_result(job)
+            if job.on_done:
+                try:
+                    await job.on_done(job)
+                except Exception as e:
+                    logger.error(f"Помилка звіту завдання #{job.id}: {e}")
+
+    async def _read_output(self, job: Job):
+        try:
+            await self._read_lines(job)
+        except Exception:
+            # Без читача процес не завершиться сам - wait() в _run чекав би вічно
+            await self._terminate(job)
+            raise
+
+    async def _read_lines(self, job: Job):
+        stream = job.process.stdout
+        while True:
+            try:
+                line = await stream.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                line = e.partial        # Кінець потоку: останній рядок без \n
+            except asyncio.LimitOverrunError as e:
+                # Рядок довший за буфер (прогрес-бар без \n, hexdump) - віддаємо шматком
+                line = await stream.read(e.consumed)
+            if not line:
+                break
+            job.bytes_out += len(line)
+            text = line.decode('utf-8', errors='replace')
+            job.output_buffer.append(text)
+            if self.on_line:
+                self.on_line(job, text)
+            if job.on_output:
+                job.on_output(job, text)
+
+    async def _terminate(self, job: Job):
+        """Зупинка всього дерева процесів завдання
+
+        З наглядачем - ескалація SIGINT -> SIGTERM -> SIGKILL з урахуванням
+        нащадків, що вийшли з групи; без нього - SIGTERM групі, після
+        KILL_GRACE - SIGKILL.
+        """
+        proc = job.process
+        if proc is None or proc.returncode is not None:
+            return
+        if self.supervisor:
+            report = await self.supervisor.stop(proc)
+            job.leaked = report.leaked
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(asyncio.shield(proc.wait()), timeout=KILL_GRACE)
+            except asyncio.TimeoutError:
+                os.killpg(proc.pid, signal.SIGKILL)
+                await proc.wait()
+        except ProcessLookupError:
+            pass
+
+    async def kill(self, job_id: int) -> bool:
+        """Скасовує завдання в черзі або зупиняє запущене"""
+        job = self.jobs.get(job_id)
+        if job is None or job.state not in ("queued", "running"):
+            return False
+        if job.state == "queued":
+            job.state = "killed"
+            job.finished = job.started = time.time()
+            job.done.set_result(job)
+            if job.on_done:
+                try:
+                    await job.on_done(job)
+                except Exception as e:
+                    logger.error(f"Помилка звіту завдання #{job.id}: {e}")
+            return True
+        job.state = "killed"
+        await self._terminate(job)
+        return True
+
+    def active(self) -> list:
+        """Запущені і ті, що чекають, за порядком виконання"""
+        running = sorted(self._running.values(), key=lambda j: j.id)
+        queued = [entry[2] for entry in sorted(self._queue) if entry[2].state == "queued"]
+        return running + queued
+
+    def recent(self, limit: int = 5) -> list:
+        finished = [j for j in self.jobs.values() if j.finished is not None]
+        return sorted(finished, key=lambda j: j.finished, reverse=True)[:limit]
+
+    def prune(self, keep: int = 50):
+        """Забуває старі завершені завдання"""
+        finished = sorted((j for j in self.jobs.values() if j.finished is not None),
+                          key=lambda j: j.finished)
+        for job in finished[:-keep]:
+            del self.jobs[job.id]
+
+
+def parse_interval(spec: str) -> int:
+    """'30s' / '5m' / '1h' / '1d' / '90' -> секунди"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    spec = spec.strip().lower()
+    if spec and spec[-1] in units:
+        return int(float(spec[:-1]) * units[spec[-1]])
+    return int(spec)
+
+
+def format_interval(seconds: int) -> str:
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+def diff_lines(old: str, new: str) -> list:
+    """Рядки, що зникли (-) і з'явились (+), без контексту"""
+    diff = difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=0)
+    return [line for line in diff
+            if line[:1] in "+-" and not line.startswith(("+++", "---"))]
+
+
+class Schedule:
+    """Команда, що повторюється з інтервалом"""
+
+    def __init__(self, schedule_id: int, command: str, interval: int, on_change: Callable):
+        self.id = schedule_id
+        self.command = command
+        self.interval = interval
+        self.on_change = on_change
+        self.last_output: Optional[str] = None
+        self.last_state: Optional[str] = None
+        self.job: Optional[Job] = None
+        self.runs = 0
+        self.changes = 0
+        self.next_run: float = 0.0
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class Scheduler:
+    """Повторювані команди поверх JobQueue: таймери замість циклів опитування"""
+
+    MIN_INTERVAL = 10  # сек
+
+    def __init__(self, queue: JobQueue):
+        self.queue = queue
+        self.schedules: dict = {}
+        self._ids = itertools.count(1)
+
+    def add(self, command: str, interval: int, on_change: Callable) -> Schedule:
+        """on_change(schedule, job, changed_lines) викликається тільки коли вивід змінився"""
+        if interval < self.MIN_INTERVAL:
+            raise ValueError(f"інтервал менший за {self.MIN_INTERVAL} с")
+        schedule = Schedule(next(self._ids), command, interval, on_change)
+        self.schedules[schedule.id] = schedule
+        schedule.next_run = asyncio.get_running_loop().time()
+        self._fire(schedule)
+        return schedule
+
+    def remove(self, schedule_id: int) -> bool:
+        schedule = self.schedules.pop(schedule_id, None)
+        if schedule is None:
+            return False
+        if schedule.handle:
+            schedule.handle.cancel()
+        return True
+
+    def _arm(self, schedule: Schedule):
+        loop = asyncio.get_running_loop()
+        # Фіксований ритм: пропускаємо запуски, що вже запізнились
+        now = loop.time()
+        schedule.next_run += schedule.interval
+        if schedule.next_run < now:
+            missed = (now - schedule.next_run) // schedule.interval + 1
+            schedule.next_run += missed * schedule.interval
+        schedule.handle = loop.call_at(schedule.next_run, self._fire, schedule)
+
+    def _fire(self, schedule: Schedule):
+        if schedule.id not in self.schedules:
+            return
+        # Попередній запуск ще не завершився - чекаємо наступного
+        if schedule.job is None or schedule.job.finished is not None:
+            schedule.job = self.queue.submit(
+                schedule.command, kind="schedule", priority=-1,
+                timeout=min(schedule.interval, self.queue.default_timeout or schedule.interval),
+                on_done=lambda job: self._done(schedule, job),
+            )
+        self._arm(schedule)
+
+    async def _done(self, schedule: Schedule, job: Job):
+        schedule.runs += 1
+        if job.state == "killed" or schedule.id not in self.schedules:
+            return
+        previous, schedule.last_output = schedule.last_output, job.output
+        state_changed = job.state != schedule.last_state
+        schedule.last_state = job.state
+        if previous is None:
+            changed = job.output.splitlines()
+        else:
+            changed = diff_lines(previous, job.output)
+        if changed or (state_changed and previous is not None):
+            schedule.changes += 1
+            await schedule.on_change(schedule, job, changed)
@@ -0,0 +1,109 @@
+"""
+Ввід у програму: послідовності клавіш і пакетування натискань
+
+Обгортка airgeddon читає stdin по рядку на клавішу ("5", "enter", "ctrlc").
+Повідомлення "5 enter 2 enter" розбирається на кілька клавіш, а швидкі
+натискання кнопок підряд збираються в один запис у stdin.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_DELAY = 0.15  # сек очікування наступного натискання перед записом
+
+# Назви клавіш у повідомленні -> рядок для обгортки
+KEY_ALIASES = {
+    "enter": "enter", "⏎": "enter", "ent": "enter",
+    "ctrlc": "ctrlc", "ctrl+c": "ctrlc", "^c": "ctrlc",
+}
+KEY_LABELS = {"enter": "⏎", "ctrlc": "⛔", "refresh": "🔄"}
+SINGLE_KEYS = set("yYnN")
+
+
+def parse_keys(text: str) -> list:
+    """Клавіші з повідомлення
+
+    Якщо всі слова - клавіші (числа, enter, ctrlc, y/n), а слів більше
+    одного, це послідовність. Інакше все повідомлення - один рядок вводу
+    (назва інтерфейсу, шлях, ESSID з пробілами).
+    """
+    words = text.split()
+    keys = []
+    for word in words:
+        key = KEY_ALIASES.get(word.lower())
+        if key is None and (word.isdigit() or word in SINGLE_KEYS):
+            key = word
+        if key is None:
+            return [text]
+        keys.append(key)
+    return keys if len(keys) > 1 else [text]
+
+
+def format_keys(keys: list) -> str:
+    return " ".join(KEY_LABELS.get(key, key) for key in keys)
+
+
+class Batch:
+    """Натискання, зібрані для одного запису"""
+
+    __slots__ = ("keys", "items", "task")
+
+    def __init__(self):
+        self.keys: list = []
+        self.items: list = []   # Дані для підтвердження (повідомлення, траса)
+        self.task: Optional[asyncio.Task] = None
+
+
+class InputBatcher:
+    """Збирає натискання за BATCH_DELAY і пише їх у stdin одним записом
+
+    write(proc, data) - запис у процес; on_flushed(batch, error) -
+    підтвердження після запису (error - виняток або None).
+    """
+
+    def __init__(self, write: Callable[..., Awaitable], on_flushed: Callable[..., Awaitable],
+                 delay: float = BATCH_DELAY):
+        self.write = write
+        self.on_flushed = on_flushed
+        self.delay = delay
+        self._pending: dict = {}   # proc -> Batch
+        self._tasks: set = set()
+
+    def submit(self, proc, keys: list, item=None, immediate: bool = False):
+        """Додає клавіші до пакета процесу (не чекає на запис)"""
+        batch = self._pending.get(proc)
+        if batch is None:
+            batch = self._pending[proc] = Batch()
+        batch.keys.extend(keys)
+        batch.items.append(item)
+        if immediate or not self.delay:
+            if batch.task:
+                batch.task.cancel()
+            batch.task = self._start(self._flush(proc, batch, 0))
+        elif batch.task is None:
+            batch.task = self._start(self._flush(proc, batch, self.delay))
+
+    def _start(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush(self, proc, batch: Batch, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        # Від цього моменту нові натискання йдуть у новий пакет
+        if self._pending.get(proc) is batch:
+            del self._pending[proc]
+        error = None
+        try:
+            await self.write(proc, "".join(f"{key}\n" for key in batch.keys).encode())
+        except Exception as e:
+            error = e
+        try:
+            await self.on_flushed(batch, error)
+        except Exception as e:
+            logger.error(f"Помилка підтвердження вводу: {e}")
@@ -0,0 +1,127 @@
+"""
+Неблокуюче логування: записи йдуть у чергу, на диск їх пише фоновий потік
+
+- діагностика бота -> stderr + bot.log (ротація за розміром, старі файли в .gz)
+- вивід процесів  -> окремий логер "output" і файл output.log з обмеженням
+  швидкості на сесію, щоб airodump не засмічував лог і не гальмував event loop
+"""
+
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+OUTPUT_FORMAT = '%(asctime)s [%(session)s] %(message)s'
+QUEUE_SIZE = 10000  # Записів у черзі; при переповненні нові відкидаються
+
+output_logger = logging.getLogger("output")
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, що ніколи не блокує: при переповненій черзі відкидає запис"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler, що стискає ротовані файли в gzip"""
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+
+class RateLimiter:
+    """Token bucket: не більше rate записів/с з запасом burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.dropped = 0
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.dropped += 1
+        return False
+
+
+class SessionLog:
+    """Лог виводу однієї сесії з обмеженням швидкості"""
+
+    def __init__(self, session: str, rate: float = 20, burst: int = 100):
+        self.limiter = RateLimiter(rate, burst)
+        self.extra = {"session": session}
+
+    def line(self, text: str):
+        if not output_logger.isEnabledFor(logging.INFO) or not self.limiter.allow():
+            return
+        if self.limiter.dropped:
+            output_logger.info("... пропущено %d рядк(ів)", self.limiter.dropped, extra=self.extra)
+            self.limiter.dropped = 0
+        output_logger.info(text, extra=self.extra)
+
+    def close(self):
+        if self.limiter.dropped:
+            output_logger.info("... пропущено %d рядк(ів)", self.limiter.dropped, extra=self.extra)
+            self.limiter.dropped = 0
+
+
+def _start_listener(logger: logging.Logger, handlers: list) -> logging.handlers.QueueListener:
+    log_queue = queue.Queue(QUEUE_SIZE)
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def setup_logging(log_file: str = "bot.log", output_file: str = "output.log",
+                  max_bytes: int = 5 * 1024 * 1024, backup_count: int = 5,
+                  level: int = logging.INFO):
+    """Налаштовує root-логер і логер виводу процесів на фонові записувачі"""
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(CompressingRotatingFileHandler(log_file, max_bytes, backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    _start_listener(root, handlers)
+
+    # Вивід процесів - окремо від діагностики бота
+    output_logger.propagate = False
+    output_logger.setLevel(logging.INFO if output_file else logging.CRITICAL + 1)
+    if output_file:
+        handler = CompressingRotatingFileHandler(output_file, max_bytes, backup_count)
+        handler.setFormatter(logging.Formatter(OUTPUT_FORMAT))
+        _start_listener(output_logger, [handler])
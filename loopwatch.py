@@ -0,0 +1,140 @@
+"""
+Сторож event loop: вимірює затримку циклу і ловить блокуючі виклики
+
+Окремий потік щоінтервалу ставить у loop порожній callback і чекає, поки той
+виконається. Затримка виконання - це lag циклу. Якщо callback не виконався
+за поріг, потік знімає стек потоку event loop (sys._current_frames) - там
+саме той синхронний виклик, що тримає цикл. Найгірші зависання зберігаються
+в кільцевому буфері для /lag.
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from tracing import percentile
+
+STACK_DEPTH = 8  # Кадрів стеку в записі зависання
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stall:
+    """Одне зависання event loop"""
+
+    __slots__ = ("started", "lag", "stack", "where")
+
+    def __init__(self, started: float, stack: list):
+        self.started = started      # time.time() початку зависання
+        self.lag = 0.0
+        self.stack = stack          # traceback.FrameSummary, від зовнішнього до внутрішнього
+        self.where = culprit(stack)
+
+    @property
+    def when(self) -> str:
+        return datetime.fromtimestamp(self.started).strftime("%H:%M:%S")
+
+    def format_stack(self) -> str:
+        return "".join(traceback.format_list(self.stack[-STACK_DEPTH:]))
+
+
+class Offender(NamedTuple):
+    """Місце в коді і скільки разів/наскільки довго воно блокувало цикл"""
+    where: str
+    count: int
+    total: float
+    worst: float
+
+
+def culprit(stack: list) -> str:
+    """Найглибший кадр нашого коду (а не бібліотек) - туди і треба дивитись"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(PROJECT_DIR) and frame.filename != __file__:
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    if stack:
+        frame = stack[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "?"
+
+
+class LoopWatchdog:
+    """Потік, що вимірює lag event loop і знімає стек при зависаннях"""
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.1,
+                 stalls: int = 50, samples: int = 3000):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: deque = deque(maxlen=stalls)
+        self.samples: deque = deque(maxlen=samples)
+        self.stall_count = 0
+        self.started: Optional[float] = None
+        self._loop = None
+        self._loop_thread: Optional[int] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop):
+        """Запуск з потоку event loop (щоб знати, чий стек знімати)"""
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _capture(self) -> list:
+        frame = sys._current_frames().get(self._loop_thread)
+        return traceback.extract_stack(frame) if frame else []
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            ran = []
+            done = threading.Event()
+
+            def beat():
+                ran.append(time.monotonic())
+                done.set()
+
+            sent = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(beat)
+            except RuntimeError:
+                return  # loop закрито
+            stall = None
+            if not done.wait(self.threshold):
+                stall = Stall(time.time() - self.threshold, self._capture())
+                while not done.wait(1.0):
+                    if self._stopped.is_set() or self._loop.is_closed():
+                        return
+            lag = ran[0] - sent
+            self.samples.append(lag)
+            if stall:
+                stall.lag = lag
+                self.stall_count += 1
+                self.stalls.append(stall)
+
+    def summary(self) -> Optional[tuple]:
+        """(кількість вимірів, p50, p99, max) lag у секундах"""
+        values = sorted(self.samples)
+        if not values:
+            return None
+        return len(values), percentile(values, 50), percentile(values, 99), values[-1]
+
+    def worst(self, limit: int = 5) -> list:
+        return sorted(self.stalls, key=lambda s: s.lag, reverse=True)[:limit]
+
+    def offenders(self, limit: int = 5) -> list:
+        """Місця в коді, згруповані за сумарним часом блокування"""
+        grouped: dict = {}
+        for stall in list(self.stalls):
+            count, total, worst = grouped.get(stall.where, (0, 0.0, 0.0))
+            grouped[stall.where] = (count + 1, total + stall.lag, max(worst, stall.lag))
+        result = [Offender(where, *values) for where, values in grouped.items()]
+        result.sort(key=lambda o: o.total, reverse=True)
+        return result[:limit]
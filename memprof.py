@@ -0,0 +1,97 @@
+"""
+Профілювання пам'яті на вимогу (/mem)
+
+tracemalloc вмикається і вимикається під час роботи: поки вимкнено, бот
+не платить нічого. Знімки порівнюються з попереднім - видно, які місця в
+коді продовжують виділяти пам'ять. Окремо - кількість живих задач asyncio
+за корутинами (завислі читачі виводу видно одразу) і RSS процесу.
+"""
+
+import asyncio
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+DEFAULT_FRAMES = 10  # Глибина стеку для кожного виділення
+
+# Виділення самого tracemalloc та імпорту не цікаві
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size процесу з /proc/self/status (Linux)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def task_counts() -> list:
+    """[(ім'я корутини, кількість)] живих задач asyncio, найчисленніші першими"""
+    counts = Counter()
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        counts[getattr(coro, "__qualname__", None) or type(coro).__name__] += 1
+    return counts.most_common()
+
+
+def format_site(stat) -> str:
+    frame = stat.traceback[0]
+    return f"{frame.filename.rsplit('/', 1)[-1]}:{frame.lineno}"
+
+
+class MemoryProfiler:
+    """Знімки tracemalloc і порівняння з попереднім знімком"""
+
+    def __init__(self):
+        self.previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def enabled(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    @property
+    def frames(self) -> int:
+        return tracemalloc.get_traceback_limit()
+
+    def start(self, frames: int = DEFAULT_FRAMES) -> bool:
+        """Вмикає трасування; True - якщо вже працювало з іншою глибиною і перезапущене"""
+        restarted = tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames
+        if restarted:
+            # Глибину не змінити на ходу - зібрані дані втрачаються
+            tracemalloc.stop()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.previous = None
+        return restarted
+
+    def stop(self):
+        """Вимикає трасування і звільняє його дані"""
+        tracemalloc.stop()
+        self.previous = None
+
+    def traced(self) -> tuple:
+        """(поточний, піковий) обсяг відстежених виділень у байтах"""
+        return tracemalloc.get_traced_memory()
+
+    def snapshot(self, limit: int = 10) -> tuple:
+        """Новий знімок: (топ місць виділення, різниця з попереднім або None)
+
+        Синхронний і важкий - з event loop викликати через asyncio.to_thread().
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        top = snapshot.statistics("lineno")[:limit]
+        diff = None
+        if self.previous is not None:
+            diff = [s for s in snapshot.compare_to(self.previous, "lineno") if s.size_diff][:limit]
+        self.previous = snapshot
+        return top, diff
@@ -0,0 +1,380 @@
+"""
+Об'єднання файлів захоплення (pcap/pcapng) в один
+
+Вхідні файли читаються потоково і зливаються за часом (k-way merge через
+heapq.merge - у пам'яті по одному кадру на файл). Одночасно відкрито не
+більше MAX_FAN_IN файлів: більші набори зливаються проходами через
+тимчасові pcapng. Точні дублікати кадрів (перекриття захоплень airgeddon)
+відкидаються за хешем з обмеженого вікна останніх кадрів, якщо копії
+розходяться в часі не більше ніж на DEDUP_SLACK_NS - той самий кадр,
+повторений пізніше, лишається. За бажанням лишаються тільки кадри, потрібні
+для хендшейку: beacon/probe response (ESSID), асоціація і EAPOL.
+
+Синхронний код - з event loop викликати через asyncio.to_thread().
+"""
+
+import hashlib
+import heapq
+import os
+import struct
+import tempfile
+from collections import deque
+from typing import Iterator, NamedTuple, Optional
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002          # Застарілий Packet Block
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BOM = 0x1A2B3C4D
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_PRISM = 119
+LINKTYPE_RADIOTAP = 127
+LINKTYPE_AVS = 163
+
+SNAPLEN = 262144
+MAX_BLOCK = 16 * 1024 * 1024    # Більший блок - пошкоджений файл
+DEDUP_WINDOW = 65536            # Хешів останніх кадрів для пошуку дублікатів
+DEDUP_SLACK_NS = 1_000_000_000  # Копії одного кадру в різних файлах - не далі 1 с
+MAX_FAN_IN = 64                 # Файлів, відкритих одночасно (RLIMIT_NOFILE)
+MERGE_EXTENSIONS = (".cap", ".pcap", ".pcapng")
+
+EAPOL_LLC = b"\xaa\xaa\x03\x00\x00\x00\x88\x8e"
+ETHERTYPE_EAPOL = b"\x88\x8e"
+# Підтипи management-кадрів: assoc req, reassoc req, probe resp, beacon
+HANDSHAKE_MGMT = {0, 2, 5, 8}
+
+
+class CaptureFormatError(Exception):
+    """Файл не є pcap/pcapng"""
+
+
+class Packet(NamedTuple):
+    ts: int          # Наносекунди від епохи
+    linktype: int
+    data: bytes
+    length: int      # Початкова довжина кадру в ефірі
+
+
+class MergeStats:
+    """Підсумок об'єднання"""
+
+    def __init__(self):
+        self.files = 0
+        self.read = 0
+        self.written = 0
+        self.duplicates = 0
+        self.filtered = 0
+        self.skipped = 0         # Кадри з linktype, що не вміщається у вихідний pcap
+        self.errors: list = []   # (файл, помилка) - пропущені або обрізані файли
+        self.format = "pcap"
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+# --- Читання ---
+
+def _read_exact(f, size: int) -> Optional[bytes]:
+    data = f.read(size)
+    return data if len(data) == size else None
+
+
+def _read_pcap(f, magic: bytes) -> Iterator[Packet]:
+    endian = "<" if struct.unpack("<I", magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS) else ">"
+    nano = struct.unpack(endian + "I", magic)[0] == PCAP_MAGIC_NS
+    header = _read_exact(f, 20)
+    if header is None:
+        return
+    linktype = struct.unpack(endian + "HHiIII", header)[5] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        head = _read_exact(f, 16)
+        if head is None:
+            return
+        sec, frac, caplen, length = record.unpack(head)
+        if caplen > MAX_BLOCK:
+            raise CaptureFormatError(f"пошкоджений запис ({caplen} байт)")
+        data = _read_exact(f, caplen)
+        if data is None:
+            return  # Обрізаний останній кадр - звична річ для перерваного захоплення
+        yield Packet(sec * 1_000_000_000 + (frac if nano else frac * 1000), linktype, data, length)
+
+
+def _tsresol(options: bytes, endian: str) -> int:
+    """Наносекунд в одиниці часу інтерфейсу (опція if_tsresol)"""
+    pos = 0
+    while pos + 4 <= len(options):
+        code, size = struct.unpack_from(endian + "HH", options, pos)
+        if code == 0:
+            break
+        if code == 9 and size >= 1:
+            value = options[pos + 4]
+            units = 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+            return max(1, 1_000_000_000 // units)
+        pos += 4 + (size + 3) // 4 * 4
+    return 1000  # За замовчуванням мікросекунди
+
+
+def _read_pcapng(f, first: bytes) -> Iterator[Packet]:
+    endian = "<"
+    interfaces: list = []       # (linktype, нс на одиницю) поточної секції
+    last_ts = 0
+    head = first
+    while True:
+        if head is None:
+            head = _read_exact(f, 8)
+            if head is None:
+                return
+        block_type = struct.unpack(endian + "I", head[:4])[0]
+        if head[:4] == b"\x0a\x0d\x0d\x0a":
+            # Нова секція: порядок байтів визначає BOM
+            bom = _read_exact(f, 4)
+            if bom is None:
+                return
+            endian = "<" if struct.unpack("<I", bom)[0] == PCAPNG_BOM else ">"
+            block_type = PCAPNG_SHB
+            total = struct.unpack(endian + "I", head[4:8])[0]
+            body_size = total - 12
+            interfaces = []
+        else:
+            total = struct.unpack(endian + "I", head[4:8])[0]
+            body_size = total - 8
+        head = None
+        if total < 12 or total > MAX_BLOCK or total % 4:
+            raise CaptureFormatError(f"пошкоджений блок pcapng ({total} байт)")
+        body = _read_exact(f, body_size)
+        if body is None:
+            return
+        body = body[:-4]  # Повторна довжина блоку в кінці
+
+        if block_type == PCAPNG_IDB:
+            linktype = struct.unpack_from(endian + "H", body, 0)[0]
+            interfaces.append((linktype, _tsresol(body[8:], endian)))
+        elif block_type == PCAPNG_EPB:
+            iface, high, low, caplen, length = struct.unpack_from(endian + "IIIII", body, 0)
+            if iface >= len(interfaces):
+                continue
+            linktype, unit = interfaces[iface]
+            last_ts = ((high << 32) | low) * unit
+            yield Packet(last_ts, linktype, body[20:20 + caplen], length)
+        elif block_type == PCAPNG_PB:
+            iface, _, high, low, caplen, length = struct.unpack_from(endian + "HHIIII", body, 0)
+            if iface >= len(interfaces):
+                continue
+            linktype, unit = interfaces[iface]
+            last_ts = ((high << 32) | low) * unit
+            yield Packet(last_ts, linktype, body[20:20 + caplen], length)
+        elif block_type == PCAPNG_SPB and interfaces:
+            # Без часу - ставимо за попереднім кадром файлу
+            length = struct.unpack_from(endian + "I", body, 0)[0]
+            yield Packet(last_ts, interfaces[0][0], body[4:4 + min(length, len(body) - 4)], length)
+
+
+def read_capture(f) -> Iterator[Packet]:
+    """Кадри файлу pcap або pcapng (формат визначається за сигнатурою)"""
+    magic = _read_exact(f, 4)
+    if magic is None:
+        return
+    if struct.unpack("<I", magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS) \
+            or struct.unpack(">I", magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        yield from _read_pcap(f, magic)
+    elif magic == b"\x0a\x0d\x0d\x0a":
+        rest = _read_exact(f, 4)
+        if rest is not None:
+            yield from _read_pcapng(f, magic + rest)
+    else:
+        raise CaptureFormatError("невідомий формат (не pcap/pcapng)")
+
+
+# --- Фільтр кадрів хендшейку ---
+
+def _ieee80211_offset(linktype: int, data: bytes) -> Optional[int]:
+    """Зміщення 802.11-заголовка після заголовка радіо"""
+    if linktype == LINKTYPE_IEEE802_11:
+        return 0
+    if linktype == LINKTYPE_RADIOTAP and len(data) >= 4:
+        return struct.unpack_from("<H", data, 2)[0]
+    if linktype == LINKTYPE_PRISM and len(data) >= 8:
+        return struct.unpack_from("<I", data, 4)[0]
+    if linktype == LINKTYPE_AVS and len(data) >= 8:
+        return struct.unpack_from(">I", data, 4)[0]
+    return None
+
+
+def is_handshake_frame(packet: Packet) -> bool:
+    """Beacon/probe response/асоціація або EAPOL; кадри невідомих типів лишаємо"""
+    data = packet.data
+    if packet.linktype == LINKTYPE_ETHERNET:
+        return data[12:14] == ETHERTYPE_EAPOL
+    offset = _ieee80211_offset(packet.linktype, data)
+    if offset is None:
+        return True
+    if len(data) < offset + 24:
+        return False
+    fc0, fc1 = data[offset], data[offset + 1]
+    frame_type, subtype = (fc0 >> 2) & 0x3, (fc0 >> 4) & 0xF
+    if frame_type == 0:
+        return subtype in HANDSHAKE_MGMT
+    if frame_type != 2 or fc1 & 0x40:  # Не дані або зашифровано
+        return False
+    header = 24
+    if fc1 & 0x03 == 0x03:             # ToDS і FromDS - є четверта адреса
+        header += 6
+    if subtype & 0x8:                  # QoS data
+        header += 2
+        if fc1 & 0x80:                 # HT control
+            header += 4
+    start = offset + header
+    return data[start:start + 8] == EAPOL_LLC
+
+
+# --- Запис ---
+
+class _PcapWriter:
+    def __init__(self, f, linktype: int):
+        self.f = f
+        self.linktype = linktype
+        f.write(struct.pack("<IHHiIII", PCAP_MAGIC_US, 2, 4, 0, 0, SNAPLEN, linktype))
+
+    def write(self, packet: Packet) -> bool:
+        if packet.linktype != self.linktype:
+            return False
+        sec, ns = divmod(packet.ts, 1_000_000_000)
+        self.f.write(struct.pack("<IIII", sec, ns // 1000, len(packet.data), packet.length))
+        self.f.write(packet.data)
+        return True
+
+
+class _PcapngWriter:
+    """pcapng з окремим інтерфейсом на кожен linktype і часом у наносекундах"""
+
+    def __init__(self, f):
+        self.f = f
+        self.interfaces: dict = {}
+        self._block(PCAPNG_SHB, struct.pack("<IHHq", PCAPNG_BOM, 1, 0, -1))
+
+    def _block(self, block_type: int, body: bytes):
+        body += b"\0" * (-len(body) % 4)
+        total = len(body) + 12
+        self.f.write(struct.pack("<II", block_type, total) + body + struct.pack("<I", total))
+
+    def write(self, packet: Packet) -> bool:
+        iface = self.interfaces.get(packet.linktype)
+        if iface is None:
+            iface = self.interfaces[packet.linktype] = len(self.interfaces)
+            # if_tsresol = 9 (наносекунди), кінець опцій
+            options = struct.pack("<HHB3x", 9, 1, 9) + struct.pack("<HH", 0, 0)
+            self._block(PCAPNG_IDB, struct.pack("<HHI", packet.linktype, 0, SNAPLEN) + options)
+        self._block(PCAPNG_EPB, struct.pack("<IIIII", iface, packet.ts >> 32, packet.ts & 0xFFFFFFFF,
+                                            len(packet.data), packet.length) + packet.data)
+        return True
+
+
+def _linktypes(paths: list) -> set:
+    """Linktype усіх файлів (за першим кадром кожного)"""
+    result = set()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                for packet in read_capture(f):
+                    result.add(packet.linktype)
+                    break
+        except (OSError, CaptureFormatError, struct.error):
+            pass
+    return result
+
+
+def _tracked(path: str, f, stats: MergeStats) -> Iterator[Packet]:
+    """Кадри файлу; помилка посеред файлу обриває тільки цей файл"""
+    try:
+        yield from read_capture(f)
+    except (CaptureFormatError, struct.error, OSError) as e:
+        stats.errors.append((path, str(e)))
+
+
+def _merge_pass(paths: list, writer, stats: MergeStats, count_input: bool, final: bool,
+                handshake_only: bool = False, dedup_window: int = 0):
+    """Один прохід k-way merge
+
+    count_input - рахувати вхідні файли і кадри (перший рівень), final -
+    рахувати записані кадри (прохід у вихідний файл).
+    """
+    files = []
+    try:
+        streams = []
+        for path in paths:
+            try:
+                f = open(path, 'rb')
+            except OSError as e:
+                stats.errors.append((path, str(e)))
+                continue
+            files.append(f)
+            streams.append(_tracked(path, f, stats))
+        if count_input:
+            stats.files += len(files)
+
+        seen: dict = {}          # хеш кадру -> час останньої копії
+        window: deque = deque()
+        for packet in heapq.merge(*streams, key=lambda p: p.ts):
+            if count_input:
+                stats.read += 1
+            if handshake_only and not is_handshake_frame(packet):
+                stats.filtered += 1
+                continue
+            if dedup_window:
+                digest = hashlib.blake2b(packet.data, digest_size=8).digest()
+                last = seen.get(digest)
+                if last is not None and packet.ts - last <= DEDUP_SLACK_NS:
+                    stats.duplicates += 1
+                    continue
+                seen[digest] = packet.ts
+                window.append((digest, packet.ts))
+                if len(window) > dedup_window:
+                    old, ts = window.popleft()
+                    if seen.get(old) == ts:
+                        del seen[old]
+            if writer.write(packet):
+                if final:
+                    stats.written += 1
+            else:
+                stats.skipped += 1
+    finally:
+        for f in files:
+            f.close()
+
+
+def merge_captures(paths: list, output, handshake_only: bool = False,
+                   dedup_window: int = DEDUP_WINDOW, fan_in: int = MAX_FAN_IN) -> MergeStats:
+    """Зливає файли в output (відкритий на запис двійковий файл) за часом кадрів
+
+    Якщо всі файли мають однаковий linktype - пише класичний pcap (його
+    читають aircrack-ng і hcxpcapngtool), інакше pcapng.
+    """
+    stats = MergeStats()
+    linktypes = _linktypes(paths)
+    if len(linktypes) <= 1:
+        writer = _PcapWriter(output, linktypes.pop() if linktypes else LINKTYPE_IEEE802_11)
+    else:
+        writer = _PcapngWriter(output)
+        stats.format = "pcapng"
+
+    with tempfile.TemporaryDirectory(prefix="pcapmerge-") as tmp:
+        sources, counted = list(paths), False
+        level = 0
+        while len(sources) > fan_in:
+            # Проміжні проходи: групи по fan_in файлів у pcapng без втрат
+            parts = []
+            for i in range(0, len(sources), fan_in):
+                part = os.path.join(tmp, f"{level}-{len(parts)}.pcapng")
+                with open(part, 'wb') as f:
+                    _merge_pass(sources[i:i + fan_in], _PcapngWriter(f), stats, not counted, False)
+                parts.append(part)
+            sources, counted = parts, True
+            level += 1
+        _merge_pass(sources, writer, stats, not counted, True, handshake_only, dedup_window)
+    return stats
@@ -0,0 +1,319 @@
+"""
+Нагляд за деревом процесів сесії
+
+Кожна сесія стартує у власній групі процесів з міткою в оточенні. Бот стає
+subreaper'ом (PR_SET_CHILD_SUBREAPER), тож нащадки, що "демонізуються" (як
+сервер tmux у airgeddon_tmux.sh), переходять до бота, а не до init, і за
+міткою їх можна віднести до сесії. Періодичне сканування /proc запам'ятовує
+всіх нащадків сесії і прибирає зомбі, що залишились боту у спадок.
+
+Зупинка ескалює SIGINT -> SIGTERM -> SIGKILL з дедлайнами і повертає
+список процесів, яких так і не вдалося зупинити.
+"""
+
+import asyncio
+import ctypes
+import itertools
+import logging
+import os
+import signal
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+PR_SET_CHILD_SUBREAPER = 36
+SCAN_INTERVAL = 2.0                     # сек між скануваннями /proc
+STOP_DEADLINES = ((signal.SIGINT, 2.0), (signal.SIGTERM, 3.0), (signal.SIGKILL, 2.0))
+POLL_INTERVAL = 0.1                     # сек між перевірками під час зупинки
+ENV_MARKER = "BOT_SESSION"              # Змінна оточення з міткою сесії
+
+
+class ProcInfo(NamedTuple):
+    """Рядок з /proc/<pid>/stat"""
+    pid: int
+    comm: str
+    state: str
+    ppid: int
+    pgrp: int
+    session: int
+    starttime: int
+
+
+def read_proc(pid: int) -> Optional[ProcInfo]:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            data = f.read().decode(errors="replace")
+    except OSError:
+        return None
+    # comm може містити пробіли і дужки - беремо до останньої ')'
+    head, _, rest = data.rpartition(")")
+    fields = rest.split()
+    return ProcInfo(pid, head.partition("(")[2], fields[0], int(fields[1]), int(fields[2]),
+                    int(fields[3]), int(fields[19]))
+
+
+def read_proc_table() -> dict:
+    """pid -> ProcInfo для всіх процесів системи"""
+    table = {}
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            info = read_proc(int(name))
+            if info:
+                table[info.pid] = info
+    return table
+
+
+def read_marker(pid: int) -> Optional[str]:
+    """Мітка сесії з /proc/<pid>/environ"""
+    try:
+        with open(f"/proc/{pid}/environ", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    prefix = ENV_MARKER.encode() + b"="
+    for item in data.split(b"\0"):
+        if item.startswith(prefix):
+            return item[len(prefix):].decode(errors="replace")
+    return None
+
+
+def enable_subreaper() -> bool:
+    """Робить поточний процес subreaper'ом для осиротілих нащадків (Linux)"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+class Session:
+    """Дерево процесів однієї сесії"""
+
+    def __init__(self, proc: asyncio.subprocess.Process, name: str, marker: str = ""):
+        self.proc = proc
+        self.name = name
+        self.marker = marker
+        self.root = proc.pid
+        self.pgid = proc.pid     # start_new_session=True: група і сесія = pid
+        self.members: dict = {}  # pid -> ProcInfo (з starttime проти повторного pid)
+        self.started = time.time()
+
+    def update(self, table: dict, adopted=()):
+        """Додає нових нащадків: за групою/сесією, ланцюжком батьків або міткою"""
+        known = {pid for pid, info in self.members.items()
+                 if pid in table and table[pid].starttime == info.starttime}
+        known.add(self.root)
+        for pid in adopted:
+            if pid in table and pid not in known:
+                known.add(pid)
+                self.members[pid] = table[pid]
+        changed = True
+        while changed:
+            changed = False
+            for pid, info in table.items():
+                if pid in known:
+                    continue
+                if info.pgrp == self.pgid or info.session == self.pgid or info.ppid in known:
+                    known.add(pid)
+                    self.members[pid] = info
+                    changed = True
+        # Забуваємо процеси, що вже завершились (або pid перевикористано)
+        for pid in list(self.members):
+            current = table.get(pid)
+            if current is None or current.starttime != self.members[pid].starttime:
+                del self.members[pid]
+
+    def alive(self, table: dict) -> list:
+        """Живі (не зомбі) процеси сесії"""
+        result = []
+        for pid, info in self.members.items():
+            current = table.get(pid)
+            if current and current.starttime == info.starttime and current.state != "Z":
+                result.append(current)
+        root = table.get(self.root)
+        if self.proc.returncode is None and root and root.state != "Z" \
+                and all(p.pid != self.root for p in result):
+            result.append(root)
+        return result
+
+
+class StopReport(NamedTuple):
+    """Результат зупинки сесії"""
+    signal: str          # Останній надісланий сигнал
+    leaked: list         # ProcInfo процесів, що пережили SIGKILL
+
+
+class Supervisor:
+    """Запускає сесії у власних групах процесів і зупиняє їх разом з нащадками"""
+
+    def __init__(self, scan_interval: float = SCAN_INTERVAL):
+        self.scan_interval = scan_interval
+        self.sessions: dict = {}  # root pid -> Session
+        self.subreaper = enable_subreaper()
+        self.reaped = 0
+        self._markers = (f"{os.getpid()}-{n}" for n in itertools.count(1))
+        self._marker_cache: dict = {}  # (pid, starttime) -> мітка
+        self._spawning: set = set()    # Мітки процесів між запуском і register()
+        self._task: Optional[asyncio.Task] = None
+
+    def _prepare(self, kwargs: dict) -> str:
+        kwargs.setdefault("start_new_session", True)
+        marker = next(self._markers)
+        env = dict(kwargs.get("env") or os.environ)
+        env[ENV_MARKER] = marker
+        kwargs["env"] = env
+        self._spawning.add(marker)
+        return marker
+
+    async def create_subprocess_exec(self, *command, name: Optional[str] = None, **kwargs):
+        marker = self._prepare(kwargs)
+        try:
+            proc = await asyncio.create_subprocess_exec(*command, **kwargs)
+        except BaseException:
+            self._spawning.discard(marker)
+            raise
+        self.register(proc, name or os.path.basename(str(command[0])), marker)
+        return proc
+
+    async def create_subprocess_shell(self, command: str, name: Optional[str] = None, **kwargs):
+        marker = self._prepare(kwargs)
+        try:
+            proc = await asyncio.create_subprocess_shell(command, **kwargs)
+        except BaseException:
+            self._spawning.discard(marker)
+            raise
+        self.register(proc, name or command.split(maxsplit=1)[0], marker)
+        return proc
+
+    def register(self, proc, name: str, marker: str = "") -> Session:
+        session = Session(proc, name, marker)
+        # Спершу сесія, потім мітка: _reap у потоці завжди бачить одне з двох
+        self.sessions[proc.pid] = session
+        self._spawning.discard(marker)
+        if self._task is None:
+            self._task = asyncio.create_task(self._scan_loop())
+        return session
+
+    def get(self, proc) -> Optional[Session]:
+        return self.sessions.get(proc.pid)
+
+    # --- Сканування /proc і прибирання зомбі ---
+
+    async def _scan_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.scan)
+            except Exception as e:
+                logger.error(f"Помилка сканування процесів: {e}")
+            await asyncio.sleep(self.scan_interval)
+
+    def scan(self) -> dict:
+        """Оновлює склад сесій і прибирає зомбі (синхронно, для to_thread)"""
+        table = read_proc_table()
+        adopted = self._adopted(table)
+        for root, session in list(self.sessions.items()):
+            session.update(table, adopted.get(session.marker, ()))
+            # Сесія завершена повністю - більше не стежимо
+            if session.proc.returncode is not None and not session.alive(table):
+                del self.sessions[root]
+        self._reap(table)
+        return table
+
+    def _adopted(self, table: dict) -> dict:
+        """Мітка -> pid осиротілих нащадків, які підхопив бот як subreaper"""
+        me = os.getpid()
+        own = {session.root for session in list(self.sessions.values())}
+        result: dict = {}
+        cache = {}
+        for pid, info in table.items():
+            if info.ppid != me or pid in own:
+                continue
+            key = (pid, info.starttime)
+            if info.state == "Z":
+                # environ зомбі вже не прочитати - зберігаємо мітку для _reap
+                if key in self._marker_cache:
+                    cache[key] = self._marker_cache[key]
+                continue
+            marker = self._marker_cache.get(key) or read_marker(pid)
+            cache[key] = marker
+            if marker:
+                result.setdefault(marker, []).append(pid)
+        self._marker_cache = cache
+        return result
+
+    def _reap(self, table: dict):
+        """waitpid() для зомбі-сиріт, що дістались боту як subreaper'у
+
+        Тільки процеси, яким _adopted приписав мітку сесії, поки вони були
+        живі. Прямих дітей, запущених через asyncio (корені сесій, зокрема
+        ті, що ще не дійшли до register()), не чіпаємо - їх статус забирає
+        child watcher asyncio, інакше він отримав би ChildProcessError і
+        код 255.
+        """
+        me = os.getpid()
+        for pid, info in table.items():
+            if info.ppid != me or info.state != "Z":
+                continue
+            marker = self._marker_cache.get((pid, info.starttime))
+            if not marker or marker in self._spawning or pid in self.sessions:
+                continue
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self.reaped += 1
+            except ChildProcessError:
+                pass
+
+    # --- Зупинка ---
+
+    def _signal(self, session: Session, sig: int, table: dict):
+        try:
+            os.killpg(session.pgid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        # Нащадки, що змінили групу (setsid, tmux) - кожному окремо
+        for info in session.alive(table):
+            if info.pgrp != session.pgid:
+                try:
+                    os.kill(info.pid, sig)
+                except (ProcessLookupError, PermissionError):
+                    pass
+
+    async def stop(self, proc, deadlines=STOP_DEADLINES) -> StopReport:
+        """Ескалація SIGINT -> SIGTERM -> SIGKILL для всього дерева сесії"""
+        session = self.get(proc) or self.register(proc, str(proc.pid))
+        loop = asyncio.get_running_loop()
+        table = await asyncio.to_thread(self.scan)
+        session.update(table)
+        sent = "-"
+        for sig, timeout in deadlines:
+            if not session.alive(table):
+                break
+            self._signal(session, sig, table)
+            sent = signal.Signals(sig).name
+            deadline = loop.time() + timeout
+            while loop.time() < deadline:
+                await asyncio.sleep(POLL_INTERVAL)
+                table = await asyncio.to_thread(read_proc_table)
+                if not session.alive(table):
+                    break
+
+        table = await asyncio.to_thread(self.scan)
+        leaked = session.alive(table)
+        if leaked:
+            logger.warning(f"Сесія '{session.name}' ({session.root}): лишились процеси "
+                           + ", ".join(f"{p.pid} ({p.comm})" for p in leaked))
+        return StopReport(sent, leaked)
+
+    def orphans(self) -> list:
+        """Живі процеси всіх сесій, корінь яких уже завершився"""
+        table = read_proc_table()
+        result = []
+        for session in list(self.sessions.values()):
+            if session.proc.returncode is not None:
+                result.extend((session.name, info) for info in session.alive(table))
+        return result
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
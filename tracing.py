@@ -0,0 +1,127 @@
+"""
+Трасування затримки від натискання кнопки до виводу програми
+
+Кожна взаємодія з stdin отримує набір позначок часу:
+  sent      - Telegram прийняв повідомлення (message.date, точність 1 с)
+  received  - бот отримав оновлення (до черги чату)
+  handler   - почав роботу наш обробник
+  stdin     - запис у stdin завершено (після drain)
+  output    - перший байт виводу після запису
+  acked     - Telegram підтвердив повідомлення з цим виводом
+
+Завершені траси зберігаються в кільцевому буфері для /trace.
+"""
+
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+PENDING_TIMEOUT = 30.0  # сек без виводу - траса закривається неповною
+
+# (назва відрізка, початкова позначка, кінцева позначка)
+SPANS = [
+    ("delivery", "sent", "received"),
+    ("queue", "received", "handler"),
+    ("stdin", "handler", "stdin"),
+    ("reaction", "stdin", "output"),
+    ("send", "output", "acked"),
+    ("total", "sent", "acked"),
+]
+
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль відсортованого списку (nearest-rank)"""
+    if not values:
+        return 0.0
+    index = max(0, math.ceil(p / 100 * len(values)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+class Trace:
+    """Одна взаємодія: натискання -> вивід"""
+
+    __slots__ = ("name", "marks")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.marks: dict = {}
+
+    def mark(self, point: str, at: Optional[float] = None):
+        self.marks.setdefault(point, time.time() if at is None else at)
+
+    def span(self, start: str, end: str) -> Optional[float]:
+        if start in self.marks and end in self.marks:
+            return self.marks[end] - self.marks[start]
+        return None
+
+
+class Tracer:
+    """Збирає траси і рахує перцентилі по відрізках"""
+
+    def __init__(self, size: int = 500):
+        self.completed: deque = deque(maxlen=size)
+        self.pending: list = []
+        self._received: OrderedDict = OrderedDict()
+
+    def update_received(self, update_id: int):
+        """Позначка отримання оновлення (викликається першою для кожного update)"""
+        self._received[update_id] = time.time()
+        if len(self._received) > 1000:
+            self._received.popitem(last=False)
+
+    def start(self, update, name: str) -> Trace:
+        """Початок обробника"""
+        trace = Trace(name)
+        trace.mark("handler")
+        received = self._received.pop(update.update_id, None)
+        if received is not None:
+            trace.mark("received", received)
+        if update.message and update.message.date:
+            trace.mark("sent", update.message.date.timestamp())
+        return trace
+
+    def stdin_written(self, trace: Trace):
+        """Запис у stdin завершено - чекаємо на вивід"""
+        trace.mark("stdin")
+        self._expire()
+        self.pending.append(trace)
+
+    def output_received(self):
+        """Прийшов вивід процесу (дешево, якщо ніхто не чекає)"""
+        if self.pending:
+            now = time.time()
+            for trace in self.pending:
+                trace.mark("output", now)
+
+    def output_delivered(self):
+        """Повідомлення з виводом доставлено в Telegram"""
+        if not self.pending:
+            return
+        now = time.time()
+        waiting = []
+        for trace in self.pending:
+            if "output" in trace.marks:
+                trace.mark("acked", now)
+                self.completed.append(trace)
+            else:
+                waiting.append(trace)
+        self.pending = waiting
+
+    def _expire(self):
+        deadline = time.time() - PENDING_TIMEOUT
+        expired = [t for t in self.pending if t.marks["stdin"] < deadline]
+        if expired:
+            self.completed.extend(expired)
+            self.pending = [t for t in self.pending if t.marks["stdin"] >= deadline]
+
+    def summary(self) -> dict:
+        """{відрізок: (кількість, p50, p90, p99, max)} у секундах"""
+        self._expire()
+        result = {}
+        for name, start, end in SPANS:
+            values = sorted(v for v in (t.span(start, end) for t in self.completed) if v is not None)
+            if values:
+                result[name] = (len(values), percentile(values, 50), percentile(values, 90),
+                                percentile(values, 99), values[-1])
+        return result
@@ -0,0 +1,52 @@
+"""
+Паралельна обробка оновлень Telegram зі збереженням порядку в межах чату
+
+Оновлення різних чатів обробляються паралельно. Оновлення одного чату -
+по черзі (ввід у програму має йти в тому порядку, в якому натиснуто кнопки),
+окрім "вільних" дій (зупинка, статус, довідкові команди), які не чекають
+на чергу чату і не блокують її.
+"""
+
+import asyncio
+from typing import Callable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Процесор оновлень з блокуванням на рівні чату"""
+
+    def __init__(self, max_concurrent_updates: int, is_free: Callable[[Update], bool],
+                 on_received: Optional[Callable[[Update], None]] = None):
+        super().__init__(max_concurrent_updates)
+        self.is_free = is_free
+        self.on_received = on_received
+        self._locks: dict = {}
+
+    async def do_process_update(self, update, coroutine):
+        if self.on_received and isinstance(update, Update):
+            self.on_received(update)
+
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None or self.is_free(update):
+            await coroutine
+            return
+
+        # chat_id -> [замок, кількість оновлень, що його тримають або чекають]
+        entry = self._locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            # Не тримаємо замки неактивних чатів
+            if entry[1] == 0:
+                del self._locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
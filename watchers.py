@@ -0,0 +1,172 @@
+"""
+Правила спостереження за виводом (/watch)
+
+Всі шаблони сесії компілюються в один автомат Ахо-Корасік, тож кожен рядок
+перевіряється за один прохід незалежно від кількості правил. Збіг дає
+сповіщення з кількома попередніми рядками як контекстом. Повтори того
+самого правила в потоці (airodump перемальовує заголовок щосекунди)
+приглушуються на WATCH_COOLDOWN.
+"""
+
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+WATCH_COOLDOWN = 60.0   # сек між сповіщеннями одного правила в одному потоці
+CONTEXT_LINES = 3       # Попередніх рядків у сповіщенні
+
+LEVELS = {"high": "🚨", "normal": "⚠️", "low": "ℹ️"}
+# Область правила - вид сесії з історії (session - airgeddon) або всі
+SCOPES = ("all", "session", "shell", "job", "schedule")
+
+
+class WatchRule(NamedTuple):
+    id: int
+    scope: str
+    pattern: str
+    level: str
+    sound: bool
+
+
+class Automaton:
+    """Ахо-Корасік без урахування регістру з повною таблицею переходів"""
+
+    def __init__(self, patterns: list):
+        goto: list = [{}]
+        out: list = [[]]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern.lower():
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(index)
+
+        # Обхід у ширину: посилання невдачі і повні переходи (delta).
+        # Стан невдачі завжди мілкіший, тож його delta вже пораховано.
+        fail = [0] * len(goto)
+        delta: list = [None] * len(goto)
+        delta[0] = dict(goto[0])
+        order = list(goto[0].values())
+        for state in order:
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            out[state] = out[state] + out[fail[state]]
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0)
+                order.append(child)
+
+        self.delta = delta
+        self.out = [tuple(o) for o in out]
+
+    def search(self, text: str) -> set:
+        """Індекси шаблонів, що є в тексті"""
+        delta, out = self.delta, self.out
+        state = 0
+        found = set()
+        for ch in text.lower():
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class WatchSet:
+    """Набір правил з автоматом, скомпільованим окремо для кожної області"""
+
+    def __init__(self):
+        self.rules: dict = {}   # id -> WatchRule
+        self.version = 0
+        self._compiled: dict = {}
+
+    def set_rules(self, rules: list):
+        self.rules = {rule.id: rule for rule in rules}
+        self._changed()
+
+    def add(self, rule: WatchRule):
+        self.rules[rule.id] = rule
+        self._changed()
+
+    def remove(self, rule_id: int) -> bool:
+        if self.rules.pop(rule_id, None) is None:
+            return False
+        self._changed()
+        return True
+
+    def _changed(self):
+        self.version += 1
+        self._compiled.clear()
+
+    def compiled(self, scope: str) -> tuple:
+        """(автомат або None, правила в порядку індексів автомата)"""
+        entry = self._compiled.get(scope)
+        if entry is None:
+            rules = [r for r in self.rules.values() if r.scope in ("all", scope)]
+            entry = (Automaton([r.pattern for r in rules]) if rules else None, rules)
+            self._compiled[scope] = entry
+        return entry
+
+
+class Alert(NamedTuple):
+    rules: list          # Правила, що спрацювали (найвищий рівень першим)
+    line: str
+    context: list        # Попередні рядки
+    suppressed: int      # Скільки повторів було приглушено з минулого сповіщення
+
+    @property
+    def level(self) -> str:
+        return self.rules[0].level
+
+    @property
+    def sound(self) -> bool:
+        return any(rule.sound for rule in self.rules)
+
+
+class StreamWatch:
+    """Стан спостереження одного потоку виводу"""
+
+    __slots__ = ("watchset", "scope", "recent", "last_alert", "suppressed", "_version",
+                 "_automaton", "_rules")
+
+    def __init__(self, watchset: WatchSet, scope: str):
+        self.watchset = watchset
+        self.scope = scope
+        self.recent: deque = deque(maxlen=CONTEXT_LINES)
+        self.last_alert: dict = {}   # id правила -> час останнього сповіщення
+        self.suppressed: dict = {}
+        self._version = -1
+        self._automaton: Optional[Automaton] = None
+        self._rules: list = []
+
+    def feed(self, line: str) -> Optional[Alert]:
+        """Перевіряє рядок; повертає сповіщення, якщо його треба надіслати"""
+        if self._version != self.watchset.version:
+            self._automaton, self._rules = self.watchset.compiled(self.scope)
+            self._version = self.watchset.version
+        alert = None
+        if self._automaton is not None:
+            found = self._automaton.search(line)
+            if found:
+                alert = self._alert(line, [self._rules[i] for i in sorted(found)])
+        self.recent.append(line)
+        return alert
+
+    def _alert(self, line: str, rules: list) -> Optional[Alert]:
+        now = time.monotonic()
+        fresh = []
+        suppressed = 0
+        for rule in rules:
+            last = self.last_alert.get(rule.id)
+            if last is not None and now - last < WATCH_COOLDOWN:
+                self.suppressed[rule.id] = self.suppressed.get(rule.id, 0) + 1
+                continue
+            self.last_alert[rule.id] = now
+            suppressed += self.suppressed.pop(rule.id, 0)
+            fresh.append(rule)
+        if not fresh:
+            return None
+        fresh.sort(key=lambda r: list(LEVELS).index(r.level))
+        return Alert(fresh, line, list(self.recent), suppressed)